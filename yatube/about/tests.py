@@ -5,7 +5,7 @@ from django.test import Client, TestCase
 
 class AboutURLTests(TestCase):
     def setUp(self):
-        super().setUpClass()
+        super().setUp()
         self.guest_client = Client()
 
     def test_about_url_exists_at_desired_location(self):
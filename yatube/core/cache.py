@@ -0,0 +1,187 @@
+"""
+Двухуровневый кэш: память процесса перед общим кэшем.
+
+L1 — ограниченный по размеру LRU в памяти воркера с коротким TTL, L2 —
+общий для всех воркеров кэш из CACHES (локально это таблица в БД).
+Чтение идёт сначала в L1, запись — сразу в оба уровня. Попадания,
+промахи и вытеснения по уровням видны в core.metrics.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',  # псевдоним кэша второго уровня
+            'OPTIONS': {'L1_MAX_BYTES': 32 * 1024 * 1024, 'L1_TIMEOUT': 5},
+        },
+        'shared': {...},
+    }
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self.l1_max_bytes = options.pop('L1_MAX_BYTES', 16 * 1024 * 1024)
+        self.l1_timeout = options.pop('L1_TIMEOUT', 5)
+        super().__init__({**params, 'OPTIONS': options})
+        self.l2_alias = location
+        self._l1 = OrderedDict()
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _seconds(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return _MISSING
+            expires, data = entry
+            if expires <= time.monotonic():
+                self._l1_discard(key)
+                return _MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(data)
+
+    def _l1_set(self, key, value, timeout):
+        if timeout is not None and timeout <= 0:
+            with self._lock:
+                self._l1_discard(key)
+            return
+        ttl = self.l1_timeout if timeout is None else min(
+            timeout, self.l1_timeout
+        )
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        evicted = 0
+        with self._lock:
+            self._l1_discard(key)
+            if len(data) > self.l1_max_bytes:
+                return
+            self._l1[key] = (time.monotonic() + ttl, data)
+            self._l1_bytes += len(data)
+            while self._l1_bytes > self.l1_max_bytes:
+                _, (_, old) = self._l1.popitem(last=False)
+                self._l1_bytes -= len(old)
+                evicted += 1
+            size = self._l1_bytes
+        if evicted:
+            metrics.incr('cache.l1.evictions', evicted)
+        metrics.gauge('cache.l1.bytes', size)
+
+    def _l1_discard(self, key):
+        entry = self._l1.pop(key, None)
+        if entry is not None:
+            self._l1_bytes -= len(entry[1])
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_key(key, version)
+        self.validate_key(l1_key)
+        value = self._l1_get(l1_key)
+        if value is not _MISSING:
+            metrics.incr('cache.l1.hits')
+            return value
+        metrics.incr('cache.l1.misses')
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            metrics.incr('cache.l2.misses')
+            return default
+        metrics.incr('cache.l2.hits')
+        self._l1_set(l1_key, value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        """
+        Значения ключей: сначала из L1, остальные одним запросом к L2.
+        """
+        found = {}
+        rest = []
+        for key in keys:
+            l1_key = self.make_key(key, version)
+            self.validate_key(l1_key)
+            value = self._l1_get(l1_key)
+            if value is _MISSING:
+                rest.append(key)
+            else:
+                found[key] = value
+        if found:
+            metrics.incr('cache.l1.hits', len(found))
+        if not rest:
+            return found
+        metrics.incr('cache.l1.misses', len(rest))
+        values = self.l2.get_many(rest, version=version)
+        if values:
+            metrics.incr('cache.l2.hits', len(values))
+        if len(values) < len(rest):
+            metrics.incr('cache.l2.misses', len(rest) - len(values))
+        for key, value in values.items():
+            self._l1_set(self.make_key(key, version), value, self.l1_timeout)
+        found.update(values)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._seconds(timeout)
+        self.l2.set(key, value, timeout, version=version)
+        self._l1_set(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._seconds(timeout)
+        failed = self.l2.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._seconds(timeout)
+        if not self.l2.add(key, value, timeout, version=version):
+            return False
+        self._l1_set(self.make_key(key, version), value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, self._seconds(timeout), version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._l1_set(self.make_key(key, version), value, self.l1_timeout)
+        return value
+
+    def forget(self, key, version=None):
+        """
+        Убирает ключ только из L1 этого процесса.
+        """
+        with self._lock:
+            self._l1_discard(self.make_key(key, version))
+
+    def forget_all(self):
+        """
+        Очищает только L1 этого процесса.
+        """
+        with self._lock:
+            self._l1.clear()
+            self._l1_bytes = 0
+
+    def delete(self, key, version=None):
+        self.forget(key, version)
+        self.l2.delete(key, version=version)
+
+    def clear(self):
+        self.forget_all()
+        self.l2.clear()
@@ -0,0 +1,7 @@
+from django.conf import settings
+
+
+def cache_timeouts(request):
+    return {
+        'post_card_cache_timeout': settings.POST_CARD_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,111 @@
+"""
+Персональные фрагменты, подставляемые в страницу после кэша.
+
+Шаблон вместо персональной разметки (меню пользователя, кнопка подписки)
+выводит заглушку {% late 'имя' параметр=значение %}. Страница с заглушками
+одинакова для всех посетителей, поэтому её можно кэшировать целиком, а
+late_fragments_middleware уже после кэша заменяет заглушки разметкой
+для текущего пользователя.
+
+Итоговая страница у вошедшего пользователя своя, поэтому к его ETag
+добавляется суффикс -u<id>, а в If-None-Match остаются только теги с
+его суффиксом.
+"""
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+PLACEHOLDER_RE = re.compile(
+    r'<!--late:(?P<name>[\w-]+)(?:\?(?P<params>[^>]*))?-->'
+)
+ETAG_RE = re.compile(r'(W/)?"([^"]*)"')
+
+_renderers = {}
+
+
+def register(name):
+    """
+    Регистрирует функцию renderer(request, **params) -> str для заглушки.
+    """
+    def decorator(renderer):
+        _renderers[name] = renderer
+        return renderer
+
+    return decorator
+
+
+def placeholder(name, **params):
+    query = urlencode(params)
+    return mark_safe(f'<!--late:{name}?{query}-->' if query
+                     else f'<!--late:{name}-->')
+
+
+def render_late(request, content):
+    """
+    Заменяет заглушки в тексте страницы фрагментами для request.user.
+    """
+    def replace(match):
+        renderer = _renderers.get(match['name'])
+        if renderer is None:
+            return ''
+        params = dict(parse_qsl(match['params'] or ''))
+        return renderer(request, **params)
+
+    return PLACEHOLDER_RE.sub(replace, content)
+
+
+def _etag_suffix(request):
+    if request.user.is_authenticated:
+        return f'-u{request.user.pk}'
+    return ''
+
+
+def bind_validators(request):
+    """
+    Оставляет в If-None-Match только теги текущего посетителя, без
+    суффикса. Если чужие теги отброшены, отбрасывается и
+    If-Modified-Since: дата одинакова для всех посетителей.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or header.strip() == '*':
+        return
+    suffix = _etag_suffix(request)
+    own = []
+    for weak, tag in ETAG_RE.findall(header):
+        if suffix and tag.endswith(suffix):
+            own.append(f'{weak}"{tag[:-len(suffix)]}"')
+        elif not suffix and not re.search(r'-u\d+$', tag):
+            own.append(f'{weak}"{tag}"')
+    if own:
+        request.META['HTTP_IF_NONE_MATCH'] = ', '.join(own)
+    else:
+        del request.META['HTTP_IF_NONE_MATCH']
+        request.META.pop('HTTP_IF_MODIFIED_SINCE', None)
+
+
+def apply(request, response):
+    """
+    Подставляет фрагменты в HTML-ответ и помечает его ETag посетителем.
+    """
+    suffix = _etag_suffix(request)
+    if suffix and response.has_header('ETag'):
+        response['ETag'] = re.sub(
+            r'"$', f'{suffix}"', response['ETag']
+        )
+    if (response.streaming or response.status_code != 200
+            or 'text/html' not in response.get('Content-Type', '')):
+        return response
+    content = response.content.decode(response.charset)
+    if '<!--late:' not in content:
+        return response
+    response.content = render_late(request, content)
+    if response.has_header('Content-Length'):
+        response['Content-Length'] = str(len(response.content))
+    return response
+
+
+@register('header_user')
+def header_user(request):
+    return render_to_string('includes/header_user.html', request=request)
@@ -0,0 +1,130 @@
+"""
+Шина инвалидации кэша между воркерами.
+
+Первый уровень TieredCache живёт в памяти каждого воркера, поэтому
+удаление ключа в одном воркере не трогает копии в остальных. Изменённые
+ключи записываются в таблицу CacheInvalidation в той же транзакции, что
+и данные, а каждый воркер не чаще раза в
+CACHE_INVALIDATION_POLL_INTERVAL секунд читает новые события и
+выбрасывает эти ключи из своего L1.
+
+Задержка распространения ограничена интервалом опроса: если с прошлого
+опроса накопилось больше POLL_BATCH_SIZE событий, воркер не разбирает
+их по очереди, а очищает свой L1 целиком. Если воркер пропустил событие
+(транзакция с меньшим id закоммитилась позже), копия всё равно истечёт
+через L1_TIMEOUT. Задержка видна в метрике cache.invalidation.delay_ms.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from . import metrics
+from .models import CacheInvalidation
+
+POLL_BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_state = {'last_id': None, 'polled_at': None, 'pruned_at': None}
+
+
+def _has_local_tier():
+    return hasattr(cache, 'forget')
+
+
+def publish(*keys):
+    """
+    Сообщает всем воркерам, что значения ключей изменились.
+    """
+    if not keys or not _has_local_tier():
+        return
+    CacheInvalidation.objects.bulk_create(
+        [CacheInvalidation(key=key) for key in keys]
+    )
+    metrics.incr('cache.invalidation.published', len(keys))
+    _prune()
+
+
+def _prune():
+    """
+    Удаляет события старше CACHE_INVALIDATION_RETENTION секунд,
+    не чаще раза за этот срок в каждом воркере.
+    """
+    retention = settings.CACHE_INVALIDATION_RETENTION
+    now = time.monotonic()
+    with _lock:
+        pruned_at = _state['pruned_at']
+        if pruned_at is not None and now - pruned_at < retention:
+            return
+        _state['pruned_at'] = now
+    CacheInvalidation.objects.filter(
+        created__lt=timezone.now() - timezone.timedelta(seconds=retention)
+    ).delete()
+
+
+def poll(force=False):
+    """
+    Применяет новые события к L1 текущего воркера.
+    Возвращает число выброшенных ключей.
+    """
+    if not _has_local_tier():
+        return 0
+    now = time.monotonic()
+    with _lock:
+        polled_at = _state['polled_at']
+        interval = settings.CACHE_INVALIDATION_POLL_INTERVAL
+        if not force and polled_at is not None and now - polled_at < interval:
+            return 0
+        _state['polled_at'] = now
+        last_id = _state['last_id']
+    if last_id is None:
+        # L1 нового воркера пуст, прошлые события ему не нужны.
+        _state['last_id'] = CacheInvalidation.objects.aggregate(
+            last_id=Max('id')
+        )['last_id'] or 0
+        return 0
+    events = list(
+        CacheInvalidation.objects.filter(id__gt=last_id).order_by(
+            'id'
+        ).values_list('id', 'key', 'created')[:POLL_BATCH_SIZE + 1]
+    )
+    if len(events) > POLL_BATCH_SIZE:
+        return _overflow()
+    received = timezone.now()
+    for event_id, key, created in events:
+        cache.forget(key)
+        metrics.observe(
+            'cache.invalidation.delay_ms',
+            (received - created).total_seconds() * 1000,
+        )
+        last_id = event_id
+    with _lock:
+        _state['last_id'] = max(_state['last_id'] or 0, last_id)
+    metrics.incr('cache.invalidation.applied', len(events))
+    return len(events)
+
+
+def _overflow():
+    """
+    Воркер отстал от журнала: L1 очищается целиком, а позиция переходит
+    в конец журнала. Возвращает 0.
+    """
+    cache.forget_all()
+    last_id = CacheInvalidation.objects.aggregate(
+        last_id=Max('id')
+    )['last_id'] or 0
+    with _lock:
+        _state['last_id'] = max(_state['last_id'] or 0, last_id)
+    metrics.incr('cache.invalidation.overflows')
+    return 0
+
+
+def reset():
+    """
+    Забывает позицию в журнале, как только что запущенный воркер.
+    """
+    with _lock:
+        _state.update(last_id=None, polled_at=None, pruned_at=None)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import media
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы картинок, на которые не осталось ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_SWEEP_GRACE,
+            help='Сколько секунд файл без ссылок ещё хранится',
+        )
+
+    def handle(self, *args, **options):
+        swept = media.sweep(grace=options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {swept}'))
@@ -0,0 +1,120 @@
+"""
+Счётчики ссылок на файлы в хранилище с адресацией по содержимому.
+
+Модель, которая сохраняет файл, вызывает retain() для нового имени и
+release() для прежнего; всё это — в транзакции вместе с самой моделью.
+Файлы, производные от исходного (варианты картинки, миниатюры),
+регистрируются attach(): они отдаются, пока на исходный файл есть
+ссылки (available()), и удаляются вместе с ним.
+
+Файл без ссылок удаляет sweep() не сразу, а спустя MEDIA_SWEEP_GRACE
+секунд: загрузка той же картинки, которая уже нашла файл на диске, но
+ещё не сохранила ссылку, успевает её сохранить. После удаления файлов
+отправляется сигнал collected, чтобы приложения убрали свои записи о
+них (например, ключи sorl-thumbnail).
+"""
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import MediaBlob
+from .storage import content_addressed_storage
+
+collected = Signal(providing_args=['name'])
+
+
+def retain(name):
+    if not name:
+        return
+    blob, created = MediaBlob.objects.get_or_create(
+        name=name, defaults={'refs': 1}
+    )
+    if not created:
+        MediaBlob.objects.filter(pk=blob.pk).update(
+            refs=F('refs') + 1, released=None
+        )
+
+
+def release(name):
+    if not name:
+        return
+    MediaBlob.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1,
+        released=Case(
+            When(refs=1, then=Value(timezone.now())),
+            default=F('released'),
+        ),
+    )
+
+
+def attach(name, derived):
+    """
+    Запоминает файлы, производные от файла name.
+    """
+    attach_many({name: derived})
+
+
+def attach_many(derived):
+    """
+    attach() для нескольких исходных файлов {имя: [производные]} двумя
+    запросами.
+    """
+    sources = dict(
+        MediaBlob.objects.filter(name__in=list(derived)).values_list(
+            'name', 'pk'
+        )
+    )
+    if not sources:
+        return
+    MediaBlob.objects.bulk_create(
+        [
+            MediaBlob(name=item, source_id=sources[name])
+            for name, items in derived.items() if name in sources
+            for item in items
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def available(name):
+    """
+    Можно ли отдавать файл: на него или на его исходный файл есть
+    ссылки. Файлы, которых нет в учёте, доступны.
+    """
+    row = MediaBlob.objects.filter(name=name).values_list(
+        'refs', 'source__refs'
+    ).first()
+    if row is None:
+        return True
+    refs, source_refs = row
+    return (refs if source_refs is None else source_refs) > 0
+
+
+def sweep(storage=content_addressed_storage, grace=None):
+    """
+    Удаляет файлы без ссылок старше grace секунд вместе с производными.
+    Возвращает число удалённых исходных файлов.
+    """
+    if grace is None:
+        grace = settings.MEDIA_SWEEP_GRACE
+    cutoff = timezone.now() - timezone.timedelta(seconds=grace)
+    candidates = MediaBlob.objects.filter(
+        refs=0, released__lte=cutoff
+    ).values_list('pk', 'name')
+    swept = 0
+    for pk, name in candidates.iterator():
+        derived = list(
+            MediaBlob.objects.filter(source_id=pk).values_list(
+                'name', flat=True
+            )
+        )
+        # Ссылка могла появиться после выборки.
+        deleted, _ = MediaBlob.objects.filter(pk=pk, refs=0).delete()
+        if not deleted:
+            continue
+        for path in [name] + derived:
+            storage.delete(path)
+        collected.send(sender=MediaBlob, name=name)
+        swept += 1
+    return swept
@@ -0,0 +1,82 @@
+"""
+Простые метрики процесса: счётчики, текущие значения и замеры времени.
+
+Значения живут в памяти воркера и отдаются страницей /metrics/
+для персонала, этого достаточно, чтобы подбирать настройки.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+
+def incr(name, value=1):
+    """
+    Увеличивает счётчик name на value.
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name, value):
+    """
+    Запоминает текущее значение величины name.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    """
+    Добавляет замер value (обычно в миллисекундах) в серию name.
+    """
+    with _lock:
+        count, total, maximum = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + value, max(maximum, value))
+
+
+@contextmanager
+def timer(name):
+    """
+    Замеряет время выполнения блока в миллисекундах.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - started) * 1000)
+
+
+def snapshot():
+    """
+    Текущие значения всех метрик в виде словаря.
+    """
+    with _lock:
+        timings = {
+            name: {
+                'count': count,
+                'avg': total / count,
+                'max': maximum,
+            }
+            for name, (count, total, maximum) in _timings.items()
+        }
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': timings,
+        }
+
+
+def reset():
+    """
+    Сбрасывает все метрики.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,24 @@
+from . import fragments, invalidation
+
+
+def cache_invalidation_middleware(get_response):
+    """
+    Перед обработкой запроса применяет события шины инвалидации кэша.
+    """
+    def middleware(request):
+        invalidation.poll()
+        return get_response(request)
+
+    return middleware
+
+
+def late_fragments_middleware(get_response):
+    """
+    Подставляет персональные фрагменты в страницу, в том числе взятую
+    из кэша.
+    """
+    def middleware(request):
+        fragments.bind_validators(request)
+        return fragments.apply(request, get_response(request))
+
+    return middleware
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:55
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def derived_to_rows(apps, schema_editor):
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    sources = MediaBlob.objects.exclude(derived='').values_list(
+        'pk', 'derived'
+    )
+    MediaBlob.objects.bulk_create(
+        [
+            MediaBlob(name=name, source_id=pk)
+            for pk, derived in sources.iterator()
+            for name in json.loads(derived)
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='core.MediaBlob', verbose_name='Исходный файл'),
+        ),
+        migrations.RunPython(derived_to_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='mediablob',
+            name='derived',
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import models
+
+
+class CacheInvalidation(models.Model):
+    """
+    Событие шины инвалидации: ключ кэша, изменённый одним из воркеров.
+    """
+    key = models.CharField('Ключ', max_length=250)
+    created = models.DateTimeField('Дата', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Инвалидация кэша'
+        verbose_name_plural = 'Инвалидации кэша'
+
+    def __str__(self):
+        return self.key
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с адресацией по содержимому и число ссылок на него.
+    У производного файла (варианта, миниатюры) ссылок нет, вместо них
+    указан исходный файл.
+    """
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    source = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='derivatives',
+        verbose_name='Исходный файл'
+    )
+    released = models.DateTimeField(
+        'Последняя ссылка снята',
+        null=True,
+        blank=True,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
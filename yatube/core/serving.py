@@ -0,0 +1,214 @@
+"""
+Отдача медиафайлов с проверкой доступа.
+
+Представление core.views.serve_media проверяет путь и права, а байты
+отдаёт тот, кто умеет это делать без копирования через Python:
+
+* MEDIA_SERVE_BACKEND = 'x-accel-redirect' — nginx: ответ с заголовком
+  X-Accel-Redirect на internal-location MEDIA_ACCEL_PREFIX;
+* 'x-sendfile' — Apache mod_xsendfile, lighttpd: X-Sendfile с путём к
+  файлу на диске;
+* 'python' — запасной вариант: FileResponse (WSGI-сервер отдаёт файл
+  через wsgi.file_wrapper, то есть sendfile) с поддержкой Range.
+
+Файлы с проверкой доступа кэшируются ненадолго (MEDIA_PROTECTED_MAX_AGE)
+и с обязательной перепроверкой, чтобы закрытый файл не продолжал
+отдаваться из кэша браузера или прокси.
+
+Приложения регистрируют проверки для своих каталогов:
+
+    @serving.register('posts/')
+    def can_view(request, path):
+        return True
+
+Статику отдаёт та же функция serve() без проверок доступа, выбирая по
+Accept-Encoding заранее сжатую копию файла (см. core.storage).
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+QVALUE_RE = re.compile(r';\s*q=([0-9.]+)')
+# Кодировка и расширение сжатой копии; лучшие первыми.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_checks = {}
+
+
+def register(prefix):
+    """
+    Регистрирует check(request, path) -> bool для файлов с путём,
+    начинающимся с prefix. Файлы без проверки отдаются всем.
+    """
+    def decorator(check):
+        _checks[prefix] = check
+        return check
+
+    return decorator
+
+
+def _check(path):
+    prefixes = [prefix for prefix in _checks if path.startswith(prefix)]
+    if not prefixes:
+        return None
+    return _checks[max(prefixes, key=len)]
+
+
+def protected(path):
+    """
+    Есть ли у файла проверка доступа.
+    """
+    return _check(path) is not None
+
+
+def allowed(request, path):
+    """
+    Разрешён ли файл: решает проверка с самым длинным подходящим префиксом.
+    """
+    check = _check(path)
+    return check is None or check(request, path)
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из Accept-Encoding, кроме запрещённых через q=0.
+    Кодировка с неразборчивым q считается неприемлемой.
+    """
+    result = set()
+    for item in (header or '').split(','):
+        coding = item.split(';', 1)[0].strip().lower()
+        match = QVALUE_RE.search(item)
+        try:
+            quality = float(match[1]) if match else 1
+        except ValueError:
+            quality = 0
+        if coding and quality > 0:
+            result.add(coding)
+    return result
+
+
+def precompressed(request, full_path):
+    """
+    Сжатая копия файла для кодировок клиента: (кодировка, расширение,
+    os.stat() копии) или None.
+    """
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted:
+            file_stat = stat_file(full_path + suffix)
+            if file_stat is not None:
+                return encoding, suffix, file_stat
+    return None
+
+
+def parse_range(header, size):
+    """
+    (начало, конец включительно) из заголовка Range для файла size байт.
+    None — заголовка нет или он не поддерживается (отдаётся весь файл),
+    False — диапазон за пределами файла.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        start, end = max(size - int(end), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+class FileSlice:
+    """
+    Файл, из которого читается не больше length байт с текущей позиции.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _headers(response, file_stat, max_age):
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def serve(request, path, full_path, file_stat, content_type=None,
+          accel_prefix=None, max_age=None):
+    """
+    Ответ с файлом для настроенного MEDIA_SERVE_BACKEND. По умолчанию
+    тип берётся из path, а префикс nginx и время кэширования — для
+    медиафайлов.
+    """
+    if content_type is None:
+        content_type = (
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+    if accel_prefix is None:
+        accel_prefix = settings.MEDIA_ACCEL_PREFIX
+    if max_age is None:
+        max_age = settings.MEDIA_CACHE_MAX_AGE
+    backend = settings.MEDIA_SERVE_BACKEND
+    if backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(accel_prefix + path)
+        return _headers(response, file_stat, max_age)
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return _headers(response, file_stat, max_age)
+    size = file_stat.st_size
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        return _headers(
+            FileResponse(file, content_type=content_type), file_stat, max_age
+        )
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(
+        FileSlice(file, end - start + 1),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return _headers(response, file_stat, max_age)
+
+
+def stat_file(full_path):
+    """
+    os.stat() обычного файла или None, если файла нет.
+    """
+    try:
+        result = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return result if stat.S_ISREG(result.st_mode) else None
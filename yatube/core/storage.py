@@ -0,0 +1,143 @@
+"""
+Хранилище с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого в подкаталоге каталога upload_to:
+posts/ab/ab12…ef.jpg. Одинаковые загрузки получают одно имя и
+записываются один раз, а миниатюры sorl, которые зависят от имени
+источника, тоже создаются один раз на все посты с этой картинкой.
+
+Файлы не удаляются вместе с моделями: число ссылок на каждый хранится в
+core.models.MediaBlob (см. core.media), а файлы без ссылок удаляет
+команда sweep_media.
+
+Статика собирается CompressedManifestStaticFilesStorage: collectstatic
+добавляет к именам хэш содержимого (css/app.3f2a…c1.css) и кладёт рядом
+сжатые копии .gz и, если установлен пакет brotli, .br. Файлы с хэшем в
+имени не меняются, поэтому core.views.serve_static отдаёт их с
+immutable-кэшированием и выбирает сжатую копию по Accept-Encoding.
+"""
+import gzip
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Уже сжатые форматы: повторное сжатие их не уменьшает.
+COMPRESSED_EXTENSIONS = frozenset((
+    '.avif', '.br', '.gif', '.gz', '.ico', '.jpeg', '.jpg', '.png',
+    '.webp', '.woff', '.woff2', '.zip',
+))
+MIN_COMPRESS_SIZE = 256
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """
+        Имя файла по его содержимому с каталогом и расширением из name.
+        """
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def _gzip(data):
+    # mtime=0: одинаковый файл даёт одинаковый .gz на каждой сборке.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def encoders():
+    """
+    Расширение сжатой копии и функция сжатия для доступных кодировок.
+    """
+    result = [('.gz', _gzip)]
+    if brotli is not None:
+        result.insert(0, ('.br', _brotli))
+    return result
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        """
+        Имя с хэшем из манифеста. Пока collectstatic не запускался
+        (разработка, тесты), файлы отдаются под исходными именами.
+        """
+        if self.hash_key(self.clean_name(name)) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def immutable(self, name):
+        """
+        Имеет ли файл хэш содержимого в имени.
+        """
+        if not hasattr(self, '_immutable'):
+            self._immutable = frozenset(self.hashed_files.values())
+        return name in self._immutable
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        self._immutable = frozenset(self.hashed_files.values())
+        names = [
+            name for name in sorted(self._immutable | set(paths))
+            if os.path.splitext(name)[1].lower() not in COMPRESSED_EXTENSIONS
+        ]
+        # zlib и brotli отпускают GIL, поэтому файлы сжимаются параллельно.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = executor.map(self.compress, names)
+            for name, written in zip(names, results):
+                for compressed in written:
+                    yield name, compressed, True
+
+    def compress(self, name):
+        """
+        Записывает сжатые копии файла, если они заметно меньше него.
+        Возвращает имена записанных копий.
+        """
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+        written = []
+        for suffix, encode in encoders():
+            compressed = encode(data)
+            if len(compressed) > len(data) * 0.95:
+                continue
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(name + suffix)
+        return written
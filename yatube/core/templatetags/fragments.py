@@ -0,0 +1,13 @@
+from django import template
+
+from core.fragments import placeholder
+
+register = template.Library()
+
+
+@register.simple_tag
+def late(name, **params):
+    """
+    Заглушка персонального фрагмента, см. core.fragments.
+    """
+    return placeholder(name, **params)
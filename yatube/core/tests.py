@@ -1,4 +1,23 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import brotli
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+
+from . import invalidation, media, metrics, serving
+from .models import MediaBlob
+from .storage import ContentAddressedStorage
+
+User = get_user_model()
 
 
 class CoreViewTest(TestCase):
@@ -9,3 +28,390 @@ class CoreViewTest(TestCase):
     def test_template_used(self):
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class MetricsViewTest(TestCase):
+    def test_metrics_for_staff_only(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        metrics.reset()
+        metrics.incr('test.counter')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.json()['counters']['test.counter'], 1)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'L1_MAX_BYTES': 300, 'L1_TIMEOUT': 60},
+    },
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+        metrics.reset()
+
+    def test_read_through(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(metrics.snapshot()['counters']['cache.l1.hits'], 1)
+
+        self.cache._l1.clear()
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['cache.l1.misses'], 1)
+        self.assertEqual(counters['cache.l2.hits'], 1)
+        self.assertEqual(counters['cache.l1.hits'], 2)
+
+    def test_get_many(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(self.shared.get('b'), 2)
+        self.cache.forget('b')
+        self.cache.forget('c')
+        with mock.patch.object(
+            self.shared, 'get_many', wraps=self.shared.get_many
+        ) as l2_get_many:
+            values = self.cache.get_many(['a', 'b', 'c', 'missing'])
+        l2_get_many.assert_called_once_with(
+            ['b', 'c', 'missing'], version=None
+        )
+        self.assertEqual(values, {'a': 1, 'b': 2, 'c': 3})
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['cache.l1.hits'], 1)
+        self.assertEqual(counters['cache.l1.misses'], 3)
+        self.assertEqual(counters['cache.l2.hits'], 2)
+        self.assertEqual(counters['cache.l2.misses'], 1)
+        self.assertEqual(self.cache.get_many(['b']), {'b': 2})
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.l1.hits'], 2
+        )
+
+    def test_miss_and_delete(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.cache.set('key', 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.l2.misses'], 2
+        )
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+
+    def test_size_eviction(self):
+        for i in range(5):
+            self.cache.set(f'key{i}', 'x' * 100)
+        self.assertLessEqual(self.cache._l1_bytes, 300)
+        self.assertNotIn(self.cache.make_key('key0'), self.cache._l1)
+        self.assertGreater(
+            metrics.snapshot()['counters']['cache.l1.evictions'], 0
+        )
+        self.assertEqual(self.cache.get('key0'), 'x' * 100)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'L1_TIMEOUT': 60},
+    },
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class InvalidationBusTest(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        metrics.reset()
+        invalidation.reset()
+        invalidation.poll()
+
+    def test_other_worker_drops_stale_copy(self):
+        self.cache.set('key', 'old')
+        # Другой воркер меняет общий уровень и публикует событие.
+        caches['shared'].set('key', 'new')
+        invalidation.publish('key')
+        self.assertEqual(self.cache.get('key'), 'old')
+
+        self.assertEqual(invalidation.poll(force=True), 1)
+        self.assertEqual(self.cache.get('key'), 'new')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['cache.invalidation.applied'], 1)
+        self.assertIn('cache.invalidation.delay_ms', snapshot['timings'])
+
+    @override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+    def test_poll_is_throttled(self):
+        invalidation.publish('key')
+        self.assertEqual(invalidation.poll(), 0)
+        self.assertEqual(invalidation.poll(force=True), 1)
+
+    def test_overflow_clears_local_tier(self):
+        self.cache.set('key', 'old')
+        caches['shared'].set('key', 'new')
+        with mock.patch.object(invalidation, 'POLL_BATCH_SIZE', 2):
+            invalidation.publish('a', 'b', 'c')
+            self.assertEqual(invalidation.poll(force=True), 0)
+            self.assertEqual(invalidation.poll(force=True), 0)
+        self.assertEqual(self.cache.get('key'), 'new')
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.invalidation.overflows'], 1
+        )
+
+    def test_middleware_polls(self):
+        invalidation.publish('key')
+        with self.settings(CACHE_INVALIDATION_POLL_INTERVAL=0):
+            self.client.get('/nonexist-page/')
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.invalidation.applied'], 1
+        )
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('posts/cat.JPG', ContentFile(b'meme'))
+        second = self.storage.save('posts/repost.jpg', ContentFile(b'meme'))
+        other = self.storage.save('posts/cat.jpg', ContentFile(b'other'))
+        digest = hashlib.sha256(b'meme').hexdigest()
+        self.assertEqual(first, f'posts/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second, first)
+        self.assertNotEqual(other, first)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.root, 'posts', digest[:2]))), 1
+        )
+
+
+class MediaBlobTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.root)
+        self.name = self.storage.save('posts/a.gif', ContentFile(b'gif'))
+        self.derived = self.storage.save(
+            'posts/variants/a.webp', ContentFile(b'webp')
+        )
+
+    def test_refcount_and_sweep(self):
+        media.retain(self.name)
+        media.retain(self.name)
+        media.attach(self.name, [self.derived])
+        media.release(self.name)
+        self.assertEqual(media.sweep(self.storage, grace=0), 0)
+        media.release(self.name)
+        blob = MediaBlob.objects.get(name=self.name)
+        self.assertEqual(blob.refs, 0)
+        self.assertIsNotNone(blob.released)
+
+        self.assertEqual(media.sweep(self.storage, grace=60), 0)
+        collected = mock.Mock()
+        media.collected.connect(collected)
+        self.addCleanup(media.collected.disconnect, collected)
+        self.assertEqual(media.sweep(self.storage, grace=0), 1)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertFalse(self.storage.exists(self.derived))
+        self.assertFalse(MediaBlob.objects.exists())
+        collected.assert_called_once_with(
+            signal=media.collected, sender=MediaBlob, name=self.name
+        )
+
+    def test_retain_after_release_keeps_file(self):
+        media.retain(self.name)
+        media.release(self.name)
+        media.retain(self.name)
+        self.assertEqual(media.sweep(self.storage, grace=0), 0)
+        self.assertTrue(self.storage.exists(self.name))
+
+
+class MediaServingTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'files'))
+        with open(os.path.join(self.root, 'files', 'a.txt'), 'wb') as file:
+            file.write(b'0123456789')
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_full_file(self):
+        response = self.client.get('/media/files/a.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_range(self):
+        response = self.client.get(
+            '/media/files/a.txt', HTTP_RANGE='bytes=2-4'
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.client.get(
+            '/media/files/a.txt', HTTP_RANGE='bytes=-3'
+        )
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(
+            '/media/files/a.txt', HTTP_RANGE='bytes=10-'
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_not_modified(self):
+        response = self.client.get('/media/files/a.txt')
+        response = self.client.get(
+            '/media/files/a.txt',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_outside_files(self):
+        for path in ('/media/files/b.txt', '/media/files/',
+                     '/media/../yatube/settings.py',
+                     '/media/files/..%2F..%2Fetc%2Fpasswd'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 404)
+
+    def test_proxy_backends(self):
+        with override_settings(MEDIA_SERVE_BACKEND='x-accel-redirect'):
+            response = self.client.get('/media/files/a.txt')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/files/a.txt'
+        )
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SERVE_BACKEND='x-sendfile'):
+            response = self.client.get('/media/files/a.txt')
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.root, 'files', 'a.txt'),
+        )
+
+    def test_access_check(self):
+        check = mock.Mock(return_value=False)
+        self.addCleanup(serving._checks.pop, 'files/')
+        serving.register('files/')(check)
+        response = self.client.get('/media/files/a.txt')
+        self.assertEqual(response.status_code, 404)
+        check.assert_called_once_with(mock.ANY, 'files/a.txt')
+
+    def test_released_post_image_is_hidden(self):
+        os.makedirs(os.path.join(self.root, 'posts'))
+        with open(os.path.join(self.root, 'posts', 'a.gif'), 'wb') as file:
+            file.write(b'gif')
+        MediaBlob.objects.create(name='posts/a.gif', refs=0)
+        response = self.client.get('/media/posts/a.gif')
+        self.assertEqual(response.status_code, 404)
+        MediaBlob.objects.filter(name='posts/a.gif').update(refs=1)
+        response = self.client.get('/media/posts/a.gif')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+    def test_derived_file_follows_source(self):
+        os.makedirs(os.path.join(self.root, 'posts', 'variants'))
+        path = os.path.join(self.root, 'posts', 'variants', 'a.webp')
+        with open(path, 'wb') as file:
+            file.write(b'webp')
+        MediaBlob.objects.create(name='posts/a.gif', refs=1)
+        media.attach('posts/a.gif', ['posts/variants/a.webp'])
+        response = self.client.get('/media/posts/variants/a.webp')
+        self.assertEqual(response.status_code, 200)
+        media.release('posts/a.gif')
+        response = self.client.get('/media/posts/variants/a.webp')
+        self.assertEqual(response.status_code, 404)
+
+
+class StaticAssetsTest(TestCase):
+    def setUp(self):
+        source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(source, 'css'))
+        self.css = b'body { margin: 0; }\n' * 100
+        with open(os.path.join(source, 'css', 'app.css'), 'wb') as file:
+            file.write(self.css)
+        with open(os.path.join(source, 'css', 'tiny.css'), 'wb') as file:
+            file.write(b'a{}')
+        settings_override = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'
+            ],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return static('css/app.css')
+
+    def test_plain_names_before_collectstatic(self):
+        self.assertEqual(static('css/app.css'), '/static/css/app.css')
+
+    def test_collectstatic_fingerprints_and_compresses(self):
+        url = self.collect()
+        self.assertRegex(url, r'^/static/css/app\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.root, url[len('/static/'):])
+        with open(path + '.gz', 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), self.css)
+        with open(path + '.br', 'rb') as file:
+            self.assertEqual(brotli.decompress(file.read()), self.css)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, 'css', 'tiny.css.gz')
+        ))
+
+    def test_serves_precompressed_immutable_files(self):
+        url = self.collect()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), self.css
+        )
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+    def test_malformed_qvalue_is_not_accepted(self):
+        url = self.collect()
+        response = self.client.get(
+            url, HTTP_ACCEPT_ENCODING='br;q=1.2.3, gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            serving.accepted_encodings('gzip;q=1.2.3, br;q=0.5'), {'br'}
+        )
+
+    def test_plain_names_are_cached_briefly(self):
+        self.collect()
+        response = self.client.get('/static/css/app.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=300', response['Cache-Control'])
+        self.assertEqual(
+            self.client.get('/static/../settings.py').status_code, 404
+        )
@@ -0,0 +1,48 @@
+"""
+Приём загружаемых файлов с ограничением размера.
+
+SizeLimitUploadHandler стоит первым в FILE_UPLOAD_HANDLERS. Пока файл
+не больше UPLOAD_MAX_SIZE, он передаёт данные дальше стандартным
+обработчикам (маленькие файлы остаются в памяти, большие пишутся во
+временный файл). Как только предел превышен, остаток файла дочитывается
+из запроса без сохранения, а в request.FILES вместо файла попадает
+RejectedUpload: форма покажет ошибку, а память на загрузку не растёт.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Файл, отброшенный из-за размера; содержимого у него нет.
+    """
+
+    def __init__(self, name, size, content_type=None):
+        super().__init__(BytesIO(), name, content_type, size)
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.rejected = (
+            self.content_length is not None
+            and self.content_length > settings.UPLOAD_MAX_SIZE
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            self.rejected = True
+        # Без данных следующие обработчики ничего не сохраняют.
+        return None if self.rejected else raw_data
+
+    def file_complete(self, file_size):
+        if self.rejected:
+            return RejectedUpload(
+                self.file_name, self.received, self.content_type
+            )
+        return None
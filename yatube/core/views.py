@@ -1,4 +1,19 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from . import metrics as metrics_registry
+from . import serving
 
 
 def page_not_found(request, exception):
@@ -15,3 +30,100 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def metrics(request):
+    """
+    Метрики текущего процесса для персонала.
+    """
+    return JsonResponse(metrics_registry.snapshot())
+
+
+def _locate(root, path):
+    """
+    Путь файла относительно root и на диске; выход за root — 404.
+    """
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    path = os.path.relpath(full_path, root).replace(os.sep, '/')
+    return path, full_path
+
+
+def _modified(request, file_stat):
+    return was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        file_stat.st_mtime,
+        file_stat.st_size,
+    )
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Медиафайл после проверки доступа. Байты отдаёт фронтовый прокси или,
+    без него, FileResponse с поддержкой Range (см. core.serving).
+    Запрещённый файл неотличим от отсутствующего: 404.
+    """
+    path, full_path = _locate(settings.MEDIA_ROOT, path)
+    if not serving.allowed(request, path):
+        raise Http404
+    file_stat = serving.stat_file(full_path)
+    if file_stat is None:
+        raise Http404
+    if not _modified(request, file_stat):
+        return HttpResponseNotModified()
+    if not serving.protected(path):
+        return serving.serve(request, path, full_path, file_stat)
+    response = serving.serve(
+        request,
+        path,
+        full_path,
+        file_stat,
+        max_age=settings.MEDIA_PROTECTED_MAX_AGE,
+    )
+    patch_cache_control(response, must_revalidate=True)
+    return response
+
+
+@require_safe
+def serve_static(request, path):
+    """
+    Собранная collectstatic статика. Отдаётся сжатая копия, подходящая
+    клиенту, а файлы с хэшем в имени кэшируются на год как immutable.
+    """
+    path, full_path = _locate(settings.STATIC_ROOT, path)
+    file_stat = serving.stat_file(full_path)
+    if file_stat is None:
+        raise Http404
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    immutable = staticfiles_storage.immutable(path)
+    encoding = None
+    compressed = serving.precompressed(request, full_path)
+    if compressed is not None:
+        encoding, suffix, file_stat = compressed
+        path += suffix
+        full_path += suffix
+    if not _modified(request, file_stat):
+        response = HttpResponseNotModified()
+    else:
+        response = serving.serve(
+            request,
+            path,
+            full_path,
+            file_stat,
+            content_type=content_type,
+            accel_prefix=settings.STATIC_ACCEL_PREFIX,
+            max_age=(
+                settings.STATIC_CACHE_MAX_AGE if immutable
+                else settings.STATIC_PLAIN_MAX_AGE
+            ),
+        )
+        if encoding and response.status_code in (200, 206):
+            response['Content-Encoding'] = encoding
+        if immutable:
+            patch_cache_control(response, immutable=True)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
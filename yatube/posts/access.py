@@ -0,0 +1,16 @@
+"""
+Проверки доступа к медиафайлам постов (см. core.serving).
+"""
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from core import media, serving
+
+
+@serving.register('posts/')
+@serving.register(sorl_settings.THUMBNAIL_PREFIX)
+def post_image(request, path):
+    """
+    Картинка удалённого поста, её варианты и миниатюры перестают
+    отдаваться сразу, не дожидаясь sweep_media.
+    """
+    return media.available(path)
@@ -0,0 +1,59 @@
+"""
+Кэш карточек постов в лентах.
+
+Карточка кэшируется тегом {% cache %} шаблона post_card.html. Ключ
+зависит от всего, что карточка выводит: поста, его миниатюры, группы и
+имени автора, поэтому правка любого из них даёт новый ключ.
+
+Каждый тег {% cache %} читает кэш отдельно, поэтому представления
+заранее получают карточки всей страницы одним get_many: прочитанные
+значения остаются в локальном уровне кэша, и теги находят их там.
+"""
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+FRAGMENT_NAME = 'post_card'
+
+
+def version(post):
+    """
+    Версия карточки поста: всё, от чего зависит её разметка.
+    """
+    return ':'.join((
+        str(post.pk),
+        str(post.updated_at.timestamp()),
+        post.thumbnail.name or '',
+        post.group.slug if post.group_id else '',
+        post.author.get_full_name(),
+    ))
+
+
+def fragment_cache():
+    """
+    Кэш, в который пишет тег {% cache %}.
+    """
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def fragment_key(post, hide_group=False):
+    """
+    Ключ, под которым тег {% cache %} хранит карточку поста.
+    Отсутствующая в шаблоне переменная hide_group даёт пустую строку.
+    """
+    return make_template_fragment_key(
+        FRAGMENT_NAME, [version(post), hide_group or '']
+    )
+
+
+def prefetch(posts, hide_group=False):
+    """
+    Читает закэшированные карточки постов одним запросом к кэшу.
+    Возвращает переданные посты.
+    """
+    keys = [fragment_key(post, hide_group) for post in posts]
+    if keys:
+        fragment_cache().get_many(keys)
+    return posts
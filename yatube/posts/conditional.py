@@ -0,0 +1,102 @@
+"""
+Условные GET-запросы для лент и страницы поста.
+
+ETag считается без загрузки страницы: для лент это версия ленты из кэша,
+для профиля и поста — одна строка со счётчиками. Совпавший ETag даёт 304
+до рендера шаблона. Посетитель в ETag не входит: его добавляет
+core.fragments.
+
+Last-Modified не отдаётся: он точен до секунды и не учитывает счётчики,
+поэтому клиент с одним If-Modified-Since получал бы устаревший 304.
+
+Ответы гостям помечаются public, чтобы их мог хранить обратный прокси;
+по истечении PAGE_PROXY_CACHE_TIMEOUT прокси перепроверяет их по ETag.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import page_cache
+from .models import Comment, Post, User
+
+
+def _etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    return _etag(
+        page_cache.feed_version(),
+        request.path,
+        page_cache.page_key(request),
+    )
+
+
+def profile_etag(request, username):
+    row = User.objects.filter(username=username).values_list(
+        'pk',
+        'stats__posts_count',
+        'stats__followers_count',
+        'stats__following_count',
+    ).first()
+    if row is None:
+        return None
+    return _etag(
+        page_cache.feed_version(),
+        *row,
+        page_cache.page_key(request),
+    )
+
+
+def _post_validators(request, post_id):
+    """
+    Время правки поста, счётчики и время последнего комментария одним
+    запросом; результат запоминается на время обработки запроса.
+    """
+    if not hasattr(request, '_post_validators'):
+        last_comment = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by('-created').values('created')[:1]
+        request._post_validators = Post.objects.filter(pk=post_id).annotate(
+            last_comment=Subquery(last_comment)
+        ).values_list(
+            'updated_at',
+            'last_comment',
+            'comments_count',
+            'author__stats__posts_count',
+            'author__stats__followers_count',
+        ).first()
+    return request._post_validators
+
+
+def post_etag(request, post_id):
+    row = _post_validators(request, post_id)
+    if row is None:
+        return None
+    return _etag(page_cache.feed_version(), *row)
+
+
+def cache_for_guests(view):
+    """
+    Гостевые ответы может кэшировать прокси, ответы вошедшим — только
+    браузер с перепроверкой.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=0,
+                s_maxage=settings.PAGE_PROXY_CACHE_TIMEOUT,
+            )
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    return wrapper
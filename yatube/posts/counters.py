@@ -0,0 +1,132 @@
+"""
+Денормализованные счётчики постов, комментариев и подписок.
+
+Сигналы моделей меняют счётчики выражениями F() в той же транзакции, что
+и сама запись, поэтому страницы читают готовые числа вместо COUNT(*).
+recount() пересчитывает их пачками и исправляет накопившиеся расхождения.
+"""
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shift(queryset, **deltas):
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def bump_user(user_id, **deltas):
+    """
+    Меняет счётчики пользователя, создавая строку при необходимости.
+    """
+    stats = UserStats.objects.filter(user_id=user_id)
+    if not _shift(stats, **deltas):
+        UserStats.objects.get_or_create(user_id=user_id)
+        _shift(stats, **deltas)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def bump_comments(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), comments_count=delta)
+
+
+def user_stats(user):
+    """
+    Счётчики пользователя; нулевые, если строки ещё нет.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def followers_count(user_id):
+    return UserStats.objects.filter(user_id=user_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def _counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def _batches(queryset, batch_size):
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def recount(batch_size=1000):
+    """
+    Пересчитывает все счётчики пачками по batch_size строк.
+    Возвращает число исправленных строк.
+    """
+    fixed = 0
+    for ids in _batches(User.objects.all(), batch_size):
+        posts = _counts(Post.objects, 'author_id', ids)
+        followers = _counts(Follow.objects, 'author_id', ids)
+        following = _counts(Follow.objects, 'user_id', ids)
+        existing = UserStats.objects.in_bulk(ids)
+        changed = []
+        for user_id in ids:
+            stats = existing.get(user_id) or UserStats(user_id=user_id)
+            actual = (
+                posts.get(user_id, 0),
+                followers.get(user_id, 0),
+                following.get(user_id, 0),
+            )
+            current = (
+                stats.posts_count,
+                stats.followers_count,
+                stats.following_count,
+            )
+            if user_id in existing and actual == current:
+                continue
+            (
+                stats.posts_count,
+                stats.followers_count,
+                stats.following_count,
+            ) = actual
+            if user_id in existing:
+                changed.append(stats)
+            else:
+                stats.save()
+            fixed += 1
+        UserStats.objects.bulk_update(
+            changed,
+            ['posts_count', 'followers_count', 'following_count']
+        )
+    for ids in _batches(Group.objects.all(), batch_size):
+        fixed += _recount_column(
+            Group, ids, 'posts_count', _counts(Post.objects, 'group_id', ids)
+        )
+    for ids in _batches(Post.objects.all(), batch_size):
+        fixed += _recount_column(
+            Post,
+            ids,
+            'comments_count',
+            _counts(Comment.objects, 'post_id', ids)
+        )
+    return fixed
+
+
+def _recount_column(model, ids, field, actual):
+    changed = []
+    for obj in model.objects.filter(pk__in=ids).only('pk', field):
+        total = actual.get(obj.pk, 0)
+        if getattr(obj, field) != total:
+            setattr(obj, field, total)
+            changed.append(obj)
+    model.objects.bulk_update(changed, [field])
+    return len(changed)
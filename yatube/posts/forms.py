@@ -1,5 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 
+from core.uploads import RejectedUpload
+
+from . import uploads
 from .models import Comment, Post
 
 
@@ -8,6 +13,45 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def full_clean(self):
+        """
+        Загруженный файл проверяет clean_image: поле image его не видит,
+        чтобы отклонённый файл не отдавался Pillow раньше проверки размера
+        и заголовка.
+        """
+        name = self.add_prefix('image')
+        files = self.files
+        self.upload = files.get(name) if self.is_bound else None
+        if self.upload is not None:
+            self.files = files.copy()
+            del self.files[name]
+        try:
+            super().full_clean()
+        finally:
+            self.files = files
+
+    def check_upload(self, upload):
+        """
+        Размер файла и заголовок картинки, до её проверки Pillow.
+        """
+        if isinstance(upload, RejectedUpload):
+            raise forms.ValidationError(
+                'Файл больше %(limit)s.',
+                code='file_too_large',
+                params={'limit': filesizeformat(settings.UPLOAD_MAX_SIZE)},
+            )
+        uploads.inspect(upload)
+
+    def clean_image(self):
+        if self.upload is None:
+            return self.cleaned_data['image']
+        self.check_upload(self.upload)
+        field = self.fields['image']
+        image = field.clean(self.upload, self.get_initial_for_field(
+            field, 'image'
+        ))
+        return uploads.sanitize(image)
+
     def validate_not_empty(self):
         data = self.cleaned_data['text']
         if data == '':
@@ -0,0 +1,35 @@
+"""
+Персональные фрагменты страниц с постами, см. core.fragments.
+"""
+from django.template.loader import render_to_string
+
+from core.fragments import register
+
+from .models import Follow
+
+
+@register('feed_switcher')
+def feed_switcher(request, active=''):
+    return render_to_string(
+        'posts/includes/switcher.html',
+        {'index': active == 'index', 'follow': active == 'follow'},
+        request=request,
+    )
+
+
+@register('follow_button')
+def follow_button(request, author):
+    """
+    Кнопка подписки на автора для вошедшего пользователя.
+    """
+    user = request.user
+    if not user.is_authenticated or user.username == author:
+        return ''
+    following = Follow.objects.filter(
+        user=user, author__username=author
+    ).exists()
+    return render_to_string(
+        'posts/includes/follow_button.html',
+        {'author': author, 'following': following},
+        request=request,
+    )
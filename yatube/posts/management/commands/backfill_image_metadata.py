@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from posts import page_cache, uploads
+from posts.models import Post
+
+
+def backfill(post_id):
+    """
+    Записывает в пост размеры и заглушку его картинки. Возвращает True,
+    если картинку удалось прочитать.
+    """
+    try:
+        post = Post.objects.filter(pk=post_id).only('image').first()
+        if post is None or not post.image:
+            return False
+        try:
+            with post.image.open('rb') as file:
+                width, height, placeholder = uploads.describe(file)
+        except (OSError, SyntaxError, ValueError):
+            return False
+        return bool(Post.objects.filter(
+            pk=post_id, image=post.image.name
+        ).update(
+            image_width=width,
+            image_height=height,
+            image_placeholder=placeholder,
+            updated_at=timezone.now(),
+        ))
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Записывает размеры и заглушки картинок существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Сколько картинок читать параллельно',
+        )
+
+    def handle(self, *args, **options):
+        missing = list(
+            Post.objects.exclude(image='').filter(
+                image_width__isnull=True
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            filled = sum(pool.map(backfill, missing))
+        if filled:
+            page_cache.bump_feed_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {filled} из {len(missing)}'
+        ))
@@ -0,0 +1,188 @@
+"""
+Замер лент на большом наборе данных.
+
+Для каждой страницы печатает план основного запроса (EXPLAIN) и задержку
+ответа без кэша: сначала без составных индексов из Meta.indexes моделей
+(они удаляются внутри транзакции, которая затем откатывается), потом с
+ними. Пример:
+
+    python manage.py bench_feeds --seed 200000 --repeat 20
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from posts import search, timeline
+from posts.counters import recount
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.views import comments_paginator
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Планы запросов и задержка лент с составными индексами и без них'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Сколько постов сгенерировать перед замером',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Сколько раз запрашивать каждую страницу',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        scenarios = self.scenarios()
+        if not scenarios:
+            self.stderr.write('Нет данных: запустите с --seed N')
+            return
+        with transaction.atomic():
+            self.drop_indexes()
+            self.report('Без составных индексов', scenarios, options)
+            transaction.set_rollback(True)
+        self.report('С составными индексами', scenarios, options)
+
+    def seed(self, posts_count):
+        users_count = max(posts_count // 100, 10)
+        User.objects.bulk_create(
+            [
+                User(username=f'bench_{random.getrandbits(48):x}_{i}')
+                for i in range(users_count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.order_by('-pk')[:users_count])
+        groups = Group.objects.bulk_create(
+            [
+                Group(
+                    title=f'Группа {i}',
+                    slug=f'bench-{random.getrandbits(48):x}-{i}',
+                    description='Группа для замеров',
+                )
+                for i in range(max(users_count // 10, 1))
+            ],
+        )
+        groups = list(Group.objects.order_by('-pk')[:len(groups)])
+        for start in range(0, posts_count, BATCH_SIZE):
+            Post.objects.bulk_create(
+                [
+                    Post(
+                        text=f'Пост для замеров {start + i}',
+                        author=random.choice(users),
+                        group=random.choice(groups + [None]),
+                    )
+                    for i in range(min(BATCH_SIZE, posts_count - start))
+                ],
+            )
+        reader = users[0]
+        Follow.objects.bulk_create(
+            [Follow(user=reader, author=author) for author in users[1:51]],
+            ignore_conflicts=True,
+        )
+        timeline.rebuild(reader.pk)
+        post = Post.objects.order_by('-pk').first()
+        Comment.objects.bulk_create(
+            [
+                Comment(post=post, author=random.choice(users), text='Ок')
+                for _ in range(500)
+            ],
+        )
+        # bulk_create не отправляет сигналы: счётчики и поисковый индекс
+        # пересчитываются разом.
+        recount(batch_size=BATCH_SIZE)
+        search.rebuild(batch_size=BATCH_SIZE)
+        self.stdout.write(f'Сгенерировано постов: {posts_count}')
+
+    def scenarios(self):
+        """
+        Страницы для замера: (название, url, запрос, нужен ли вход).
+        """
+        post = Post.objects.order_by('-comments_count').first()
+        if post is None:
+            return []
+        author = post.author
+        group = Group.objects.order_by('-posts_count').first()
+        reader = User.objects.order_by('-stats__following_count').first()
+        comments = comments_paginator(post.pk)
+        ordering = ('-pub_date', '-id')
+        scenarios = [
+            (
+                'index',
+                reverse('posts:index'),
+                Post.objects.for_feed().order_by(*ordering)[:10],
+                None,
+            ),
+            (
+                'profile',
+                reverse('posts:profile', args=[author.username]),
+                Post.objects.for_feed().filter(
+                    author=author
+                ).order_by(*ordering)[:10],
+                None,
+            ),
+            (
+                'post_detail',
+                reverse('posts:post_detail', args=[post.pk]),
+                comments.object_list[:comments.per_page + 1],
+                None,
+            ),
+            (
+                'follow_index',
+                reverse('posts:follow_index'),
+                timeline.entries(reader)[:10],
+                reader,
+            ),
+        ]
+        if group is not None:
+            scenarios.append((
+                'group_posts',
+                reverse('posts:group_posts', args=[group.slug]),
+                group.posts.for_feed().order_by(*ordering)[:10],
+                None,
+            ))
+        return scenarios
+
+    def drop_indexes(self):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, Follow, TimelineEntry):
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+
+    def report(self, title, scenarios, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, url, queryset, user in scenarios:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            timings = []
+            for _ in range(options['repeat']):
+                cache.clear()
+                started = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{name}: медиана {statistics.median(timings):.1f} мс, '
+                f'p95 {p95:.1f} мс'
+            )
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
@@ -0,0 +1,102 @@
+"""
+Замер экономии байтов на адаптивных вариантах картинок.
+
+Каждая картинка каталога режется в миниатюру для лент в JPEG (как
+sorl-thumbnail сейчас) и в варианты из posts.variants; печатается
+суммарный размер по формату и ширине и экономия относительно JPEG.
+Файлы не сохраняются. Пример:
+
+    python manage.py bench_image_variants media/posts --workers 4
+"""
+import io
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts import thumbnails, variants
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def measure(path):
+    """
+    Размеры одной картинки: {'original': ..., 'jpeg': ...,
+    (формат, ширина): ...}.
+    """
+    sizes = {'original': os.path.getsize(path)}
+    with open(path, 'rb') as file:
+        sizes.update(
+            (key, len(data)) for key, data in variants.render(file).items()
+        )
+        file.seek(0)
+        with Image.open(file) as source:
+            image = ImageOps.fit(
+                source.convert('RGB'),
+                thumbnails.feed_size(max(settings.IMAGE_VARIANT_WIDTHS)),
+                method=Image.LANCZOS,
+            )
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=sorl_settings.THUMBNAIL_QUALITY)
+    sizes['jpeg'] = len(buffer.getvalue())
+    return sizes
+
+
+class Command(BaseCommand):
+    help = 'Экономия байтов WebP/AVIF-вариантов на каталоге картинок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог с картинками')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Сколько картинок обрабатывать параллельно',
+        )
+
+    def handle(self, *args, **options):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(options['path'])
+            for name in names
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if not paths:
+            self.stderr.write('В каталоге нет картинок')
+            return
+        totals = Counter()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for sizes in pool.map(self.safe_measure, paths):
+                if sizes is None:
+                    failed += 1
+                else:
+                    totals.update(sizes)
+        self.report(len(paths) - failed, failed, totals)
+
+    def safe_measure(self, path):
+        try:
+            return measure(path)
+        except (OSError, ValueError) as error:
+            self.stderr.write(f'{path}: {error}')
+            return None
+
+    def report(self, count, failed, totals):
+        baseline = totals['jpeg']
+        self.stdout.write(
+            f'Картинок: {count}, пропущено: {failed}\n'
+            f'Оригиналы: {totals["original"]} байт\n'
+            f'JPEG {thumbnails.FEED_GEOMETRY}: {baseline} байт'
+        )
+        for pil_format, _, _, _ in variants.formats():
+            for width in settings.IMAGE_VARIANT_WIDTHS:
+                size = totals[pil_format, width]
+                saving = 100 * (1 - size / baseline) if baseline else 0
+                self.stdout.write(
+                    f'{pil_format} {width}w: {size} байт '
+                    f'(экономия к JPEG {saving:.1f}%)'
+                )
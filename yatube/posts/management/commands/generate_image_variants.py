@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import variants
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие адаптивные варианты картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Сколько картинок обрабатывать параллельно',
+        )
+
+    def handle(self, *args, **options):
+        missing = list(
+            Post.objects.exclude(image='').filter(variants='').order_by(
+                'pk'
+            ).values_list('pk', flat=True)
+        )
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            created = sum(pool.map(variants.build_in_thread, missing))
+        self.stdout.write(self.style.SUCCESS(
+            f'Созданы варианты картинок: {created} из {len(missing)}'
+        ))
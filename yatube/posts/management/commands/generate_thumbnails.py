@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает в посты готовые миниатюры и создаёт недостающие'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Сколько миниатюр создавать параллельно',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов проверять за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(
+            thumbnail=''
+        ).order_by().only('image', 'thumbnail')
+        checked = 0
+        batch = []
+        missing = []
+        for post in posts.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            batch.append(post)
+            if len(batch) == options['batch_size']:
+                missing += self.resolve(batch)
+                batch = []
+        missing += self.resolve(batch)
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            created = sum(pool.map(thumbnails.generate_in_thread, missing))
+        self.stdout.write(self.style.SUCCESS(
+            f'Найдено готовых миниатюр: {checked - len(missing)}, '
+            f'создано: {created} из {len(missing)}'
+        ))
+
+    def resolve(self, posts):
+        """
+        id постов, для которых готовой миниатюры не нашлось.
+        """
+        thumbnails.resolve(posts)
+        return [post.pk for post in posts if not post.thumbnail]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Досылает в ленты посты авторов, вышедших из pull-режима, и '
+        'обрезает ленты до TIMELINE_MAX_LENGTH записей; запускается '
+        'периодически'
+    )
+
+    def handle(self, *args, **options):
+        settled = timeline.settle_pending()
+        trimmed = timeline.trim()
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов вернулось в push-режим: {settled}, '
+            f'удалено записей лент: {trimmed}'
+        ))
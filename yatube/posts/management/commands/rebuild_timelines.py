@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Пересобрать ленту только указанного пользователя',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not user_ids:
+            user_ids = set(
+                Follow.objects.values_list('user_id', flat=True).distinct()
+            ) | set(
+                TimelineEntry.objects.values_list(
+                    'user_id', flat=True
+                ).distinct()
+            )
+        for user_id in sorted(user_ids):
+            timeline.rebuild(user_id)
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересобрано лент: {len(user_ids)}')
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:35
+
+import core.storage
+from django.db import migrations, models
+
+
+def count_image_refs(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    images = Post.objects.exclude(image='').order_by().values(
+        'image'
+    ).annotate(total=models.Count('id'))
+    MediaBlob.objects.bulk_create(
+        [
+            MediaBlob(name=row['image'], refs=row['total'])
+            for row in images.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_media_blob'),
+        ('posts', '0017_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(count_image_refs, migrations.RunPython.noop),
+    ]
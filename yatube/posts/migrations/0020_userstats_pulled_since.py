@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_timeline_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='pulled_since',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Посты не раскладываются по лентам с'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:58
+
+from django.db import migrations
+
+
+def attach_thumbnails(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    sources = dict(MediaBlob.objects.filter(
+        source__isnull=True
+    ).values_list('name', 'pk'))
+    pairs = Post.objects.exclude(thumbnail='').order_by().values_list(
+        'image', 'thumbnail'
+    ).distinct()
+    MediaBlob.objects.bulk_create(
+        [
+            MediaBlob(name=thumbnail, source_id=sources[image])
+            for image, thumbnail in pairs.iterator()
+            if image in sources
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_media_blob_source'),
+        ('posts', '0020_userstats_pulled_since'),
+    ]
+
+    operations = [
+        migrations.RunPython(attach_thumbnails, migrations.RunPython.noop),
+    ]
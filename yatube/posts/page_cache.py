@@ -0,0 +1,142 @@
+"""
+Версионированные ключи кэша страниц с постами.
+
+Версия ленты хранится в кэше и меняется сигналами Post, Group и User, поэтому
+закэшированные фрагменты устаревают сразу после изменения данных, а не
+по истечении TTL. Старые фрагменты просто перестают читаться и
+вытесняются кэшем.
+
+Версия — время последнего изменения в наносекундах.
+
+Страницы лент целиком кэшируются декоратором
+stale_while_revalidate: устаревшая страница отдаётся, пока её
+пересчитывает ровно один запрос, а одновременные промахи по одному
+ключу ждут его результата вместо собственного рендера.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from core import invalidation, metrics
+
+FEED_VERSION_KEY = 'posts:feed:version'
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def feed_version():
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        # Отметка времени не повторит версию, вытесненную из кэша.
+        version = time.time_ns()
+        cache.add(FEED_VERSION_KEY, version, None)
+        version = cache.get(FEED_VERSION_KEY, version)
+    return version
+
+
+def bump_feed_version():
+    current = cache.get(FEED_VERSION_KEY) or 0
+    cache.set(FEED_VERSION_KEY, max(time.time_ns(), current + 1), None)
+    invalidation.publish(FEED_VERSION_KEY)
+
+
+def page_key(request):
+    """
+    Положение страницы в ленте: номер или курсор из параметров запроса.
+    """
+    return '&'.join(
+        f'{param}={request.GET[param]}'
+        for param in PAGE_PARAMS if param in request.GET
+    ) or 'page=1'
+
+
+def _entry_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'posts:page:{path}'
+
+
+def _store(key, version, response):
+    """
+    Запоминает успешный ответ вместе с версией ленты.
+    """
+    if response.status_code == 200 and not response.cookies:
+        cache.set(
+            key,
+            {
+                'version': version,
+                'fresh_until': time.time() + settings.PAGE_CACHE_TIMEOUT,
+                'content': response.content,
+                'headers': dict(response.items()),
+            },
+            settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT,
+        )
+    return response
+
+
+def _respond(request, entry):
+    response = HttpResponse(entry['content'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        response=response,
+    )
+
+
+def _wait(key, version):
+    """
+    Ждёт, пока другой запрос положит в кэш свежую страницу.
+    """
+    deadline = time.monotonic() + settings.PAGE_CACHE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.PAGE_CACHE_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+    return None
+
+
+def stale_while_revalidate(view):
+    """
+    Кэш страниц ленты с отдачей устаревшей копии. Персональные части
+    страницы — заглушки core.fragments, поэтому копия общая для всех.
+
+    Свежая копия (та же версия ленты, не старше PAGE_CACHE_TIMEOUT)
+    отдаётся сразу. Иначе пересчёт выполняет запрос, взявший блокировку
+    ключа; остальные получают устаревшую копию, а если её нет — ждут
+    результата. Счётчики page_cache.* видны в метриках.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+        key = _entry_key(request)
+        version = feed_version()
+        entry = cache.get(key)
+        if (entry is not None and entry['version'] == version
+                and entry['fresh_until'] > time.time()):
+            metrics.incr('page_cache.hits')
+            return _respond(request, entry)
+        lock = f'{key}:lock'
+        if cache.add(lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            metrics.incr('page_cache.recomputes')
+            try:
+                return _store(key, version, view(request, *args, **kwargs))
+            finally:
+                cache.delete(lock)
+        if entry is not None:
+            metrics.incr('page_cache.stale')
+            return _respond(request, entry)
+        entry = _wait(key, version)
+        if entry is not None:
+            metrics.incr('page_cache.coalesced')
+            return _respond(request, entry)
+        metrics.incr('page_cache.misses')
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,271 @@
+"""
+Пагинация лент постов.
+
+Кроме привычных номеров страниц (?page=N, OFFSET и COUNT(*)) лента
+листается по курсорам ?after= / ?before=: непрозрачный токен хранит ключ
+сортировки (pub_date, id) крайнего поста, и следующая страница читается
+условием по индексу, поэтому стоит одинаково на любой глубине.
+
+Число записей для номеров страниц CountingPaginator берёт из
+денормализованных счётчиков (группа, автор) или из кэша по области
+видимости (вся лента, лента подписчика). Кэш сбрасывается сигналами
+моделей, а выше порога точный COUNT(*) заменяется оценкой.
+"""
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from core import invalidation
+
+CURSOR_SEPARATOR = '|'
+
+
+class NumberedPaginator(Paginator):
+    """
+    Paginator с компактным списком номеров страниц.
+    """
+    ELLIPSIS = '…'
+
+    def get_elided_page_range(self, number=1, on_each_side=3, on_ends=2):
+        """
+        Номера страниц для навигации: края и окно вокруг текущей страницы,
+        пропуски обозначены ELLIPSIS. Длина не зависит от числа страниц.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (self.num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def numbered_page(self, number):
+        """
+        Страница по номеру со списком номеров для навигации.
+        """
+        page = self.get_page(number)
+        page.elided_page_range = list(
+            self.get_elided_page_range(page.number)
+        )
+        return page
+
+    def page_for_request(self, request):
+        """
+        Страница по номеру из ?page=.
+        """
+        return self.numbered_page(request.GET.get('page'))
+
+
+class CursorPaginator(NumberedPaginator):
+    """
+    Paginator с поддержкой курсорной (keyset) пагинации.
+
+    ordering задаёт полный порядок записей: все поля в одном направлении,
+    последнее поле уникально (обычно id).
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-id'), **kwargs):
+        self.ordering = ordering
+        self.keys = [field.lstrip('-') for field in ordering]
+        self.descending = ordering[0].startswith('-')
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+
+    def encode_cursor(self, obj):
+        """
+        Непрозрачный токен с ключом сортировки объекта.
+        """
+        raw = CURSOR_SEPARATOR.join(
+            str(getattr(obj, key)) for key in self.keys
+        )
+        return urlsafe_base64_encode(raw.encode())
+
+    def decode_cursor(self, token):
+        """
+        Значения ключа сортировки из токена или None для битого токена.
+        """
+        try:
+            raw = urlsafe_base64_decode(token).decode()
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return None
+        parts = raw.split(CURSOR_SEPARATOR)
+        if len(parts) != len(self.keys):
+            return None
+        opts = self.object_list.model._meta
+        try:
+            return [
+                opts.get_field(key).to_python(value)
+                for key, value in zip(self.keys, parts)
+            ]
+        except ValidationError:
+            return None
+
+    def _seek(self, values, forward):
+        """
+        Записи строго за курсором в направлении листания.
+        """
+        lookup = 'lt' if forward == self.descending else 'gt'
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[index]})
+            for prev_key, prev_value in zip(self.keys, values[:index]):
+                step &= Q(**{prev_key: prev_value})
+            condition |= step
+        ordering = self.ordering
+        if not forward:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        return self.object_list.filter(condition).order_by(*ordering)
+
+    def cursor_page(self, after=None, before=None):
+        """
+        Страница после курсора after или перед курсором before; для
+        битого или устаревшего курсора — первая страница.
+
+        Номер такой страницы неизвестен (number is None): он потребовал бы
+        COUNT(*), которого курсорная пагинация как раз избегает.
+        """
+        values = self.decode_cursor(after or before)
+        if values is None:
+            return self.numbered_page(1)
+        forward = bool(after)
+        rows = list(self._seek(values, forward)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        page = Page(rows, None, self)
+        self._set_cursors(
+            page,
+            has_previous=more if not forward else True,
+            has_next=more if forward else True,
+        )
+        return page
+
+    def page_after(self, token=None):
+        """
+        Страница после курсора token или, без него, первая страница.
+
+        Для списков, которые листаются только вперёд: COUNT(*) не нужен
+        даже для первой страницы, на каждую уходит один запрос.
+        """
+        values = self.decode_cursor(token) if token else None
+        if values is None:
+            rows = self.object_list
+        else:
+            rows = self._seek(values, forward=True)
+        rows = list(rows[:self.per_page + 1])
+        page = Page(rows[:self.per_page], None, self)
+        self._set_cursors(
+            page, has_previous=False, has_next=len(rows) > self.per_page
+        )
+        return page
+
+    def page_for_request(self, request):
+        """
+        Страница по параметрам запроса: ?after=, ?before= или ?page=.
+        """
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        if after or before:
+            return self.cursor_page(after=after, before=before)
+        return super().page_for_request(request)
+
+    def numbered_page(self, number):
+        page = super().numbered_page(number)
+        self._set_cursors(
+            page,
+            has_previous=page.has_previous(),
+            has_next=page.has_next(),
+        )
+        return page
+
+    def _set_cursors(self, page, has_previous, has_next):
+        page.previous_cursor = page.next_cursor = None
+        if not len(page):
+            return
+        if has_previous:
+            page.previous_cursor = self.encode_cursor(page[0])
+        if has_next:
+            page.next_cursor = self.encode_cursor(page[-1])
+
+
+def count_cache_key(scope):
+    return f'paginator:count:{scope}'
+
+
+def invalidate_counts(*scopes):
+    """
+    Сбрасывает закэшированное число записей для областей видимости.
+    """
+    keys = [count_cache_key(scope) for scope in scopes]
+    cache.delete_many(keys)
+    invalidation.publish(*keys)
+
+
+def estimate_table_size(model):
+    """
+    Оценка размера таблицы по максимальному первичному ключу.
+
+    Читает одну строку индекса вместо полного COUNT(*); удалённые строки
+    завышают оценку, что для номеров страниц допустимо.
+    """
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+class CountingPaginator(CursorPaginator):
+    """
+    Paginator, не считающий записи на каждый запрос.
+
+    Если число записей уже известно (денормализованный счётчик), оно
+    передаётся в count. Иначе оно берётся из кэша области видимости
+    scope, а при промахе считается не больше
+    PAGINATOR_COUNT_ESTIMATE_THRESHOLD записей; если их больше и передан
+    estimate, используется оценка.
+    """
+
+    def __init__(self, object_list, per_page, scope=None, count=None,
+                 estimate=None, **kwargs):
+        self.scope = scope
+        self.known_count = count
+        self.estimate = estimate
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        key = count_cache_key(self.scope)
+        count = cache.get(key)
+        if count is None:
+            count = self._bounded_count()
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+    def _bounded_count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return self.object_list.count()
+        limit = settings.PAGINATOR_COUNT_ESTIMATE_THRESHOLD
+        count = self.object_list[:limit + 1].count()
+        if count > limit and self.estimate is not None:
+            count = max(count, self.estimate())
+        return count
@@ -0,0 +1,142 @@
+"""
+Полнотекстовый поиск по постам.
+
+Тексты постов хранятся в виртуальной таблице SQLite FTS5 (инвертированный
+индекс), rowid строки равен id поста. Индекс обновляется сигналами модели
+Post, а результаты сортируются по релевантности (bm25).
+
+Русские слова приводятся к основе отбрасыванием окончаний и ищутся по
+префиксу, поэтому «котами» находит «кот», «коты» и «котом». На других
+СУБД поиск откатывается к LIKE по тем же основам.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+MIN_STEM_LENGTH = 3
+MAX_TERMS = 10
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+ENDINGS = sorted(
+    (
+        'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+        'ать', 'ять', 'ить', 'еть', 'ешь', 'ете', 'ите', 'ала', 'ила',
+        'ией', 'ия', 'ие', 'ий', 'ой', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые',
+        'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ей', 'ую',
+        'юю', 'ть', 'ла', 'ло', 'ли', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят',
+        'а', 'я', 'о', 'е', 'и', 'ы', 'у', 'ю', 'ь', 'й',
+    ),
+    key=len,
+    reverse=True,
+)
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def stem(word):
+    """
+    Основа русского слова без окончания; прочие слова не меняются.
+    """
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def terms(query):
+    """
+    Основы слов поискового запроса без повторов.
+    """
+    stems = []
+    for word in WORD_RE.findall(normalize(query)):
+        word = stem(word)
+        if word not in stems:
+            stems.append(word)
+    return stems[:MAX_TERMS]
+
+
+def match_expression(stems):
+    """
+    Запрос FTS5: все основы как префиксы, кавычки экранируют синтаксис.
+    """
+    return ' AND '.join(f'"{word}"*' for word in stems)
+
+
+def index_post(post):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, normalize(post.text)],
+        )
+
+
+def unindex_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild(batch_size=1000):
+    """
+    Строит индекс заново по всем постам. Возвращает их число.
+    """
+    if not available():
+        return 0
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = Post.objects.order_by().values_list('pk', 'text')
+        batch = []
+        for pk, text in rows.iterator(chunk_size=batch_size):
+            batch.append((pk, normalize(text)))
+            if len(batch) == batch_size:
+                total += _insert(cursor, batch)
+                batch = []
+        total += _insert(cursor, batch)
+    return total
+
+
+def _insert(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+    )
+    return len(rows)
+
+
+def search(queryset, query):
+    """
+    Посты queryset, подходящие под запрос, от более релевантных к менее.
+    """
+    stems = terms(query)
+    if not stems:
+        return queryset.none()
+    if not available():
+        for word in stems:
+            queryset = queryset.filter(text__icontains=word)
+        return queryset.order_by('-pub_date', '-id')
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match_expression(stems)],
+        select={'search_rank': f'{FTS_TABLE}.rank'},
+    ).order_by('search_rank', '-pub_date', '-id')
@@ -0,0 +1,174 @@
+import logging
+
+from django.core.files import File
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core import media
+
+from . import (counters, page_cache, search, thumbnails, timeline, uploads,
+               variants)
+from .models import Comment, Follow, Group, Post, User
+from .paginators import invalidate_counts
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    """
+    Запоминает исходную группу поста, чтобы поправить счётчик старой группы,
+    и картинку, чтобы создать миниатюру только для новой.
+    Отложенные поля не читаются, чтобы не делать лишний запрос.
+    """
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    image = instance.__dict__.get('image')
+    if isinstance(image, File) and not getattr(image, '_committed', False):
+        # Ещё не сохранённая загрузка, например Post(image=upload).
+        image = None
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=Post)
+def image_changed(sender, instance, raw=False, **kwargs):
+    """
+    Миниатюра и варианты прежней картинки новой не подходят; размеры и
+    заглушка новой картинки считаются, пока её файл ещё в памяти.
+    """
+    instance._image_replaced = (
+        not raw and instance.image.name != instance._loaded_image
+    )
+    if not instance._image_replaced:
+        return
+    instance.thumbnail = ''
+    instance.variants = ''
+    instance.image_width = instance.image_height = None
+    instance.image_placeholder = ''
+    if not instance.image:
+        return
+    try:
+        (instance.image_width, instance.image_height,
+         instance.image_placeholder) = uploads.describe(instance.image)
+    except (OSError, SyntaxError, ValueError) as error:
+        logger.warning('Не удалось прочитать картинку %s: %s',
+                       instance.image.name, error)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Новый пост увеличивает счётчики автора и группы и попадает в ленты
+    подписчиков; при смене группы поправляются счётчики обеих групп.
+    Текст поста (пере)индексируется для поиска, для новой картинки в фоне
+    создаются миниатюра и адаптивные варианты; ссылка переходит с прежнего
+    файла картинки на новый.
+    """
+    if raw:
+        return
+    page_cache.bump_feed_version()
+    search.index_post(instance)
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        counters.bump_group(instance.group_id, 1)
+        invalidate_counts('posts')
+        timeline.fan_out(instance)
+    elif instance._loaded_group_id != instance.group_id:
+        counters.bump_group(instance._loaded_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+    if instance._image_replaced:
+        thumbnails.schedule(instance)
+        variants.schedule(instance)
+    if instance.image.name != instance._loaded_image:
+        media.retain(instance.image.name)
+        media.release(instance._loaded_image)
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """
+    Удалённый пост больше не учитывается в счётчиках и не ищется, а его
+    картинка теряет ссылку: файл удалит sweep_media.
+    """
+    page_cache.bump_feed_version()
+    search.unindex_post(instance.pk)
+    counters.bump_user(instance.author_id, posts_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    invalidate_counts('posts')
+    media.release(instance._loaded_image)
+
+
+@receiver(media.collected)
+def image_collected(sender, name, **kwargs):
+    """
+    Миниатюры sorl удалённого файла удаляются вместе с ключами.
+    """
+    thumbnails.forget(name)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, raw=False, **kwargs):
+    """
+    Название и адрес группы выводятся в ленте, её кэш устаревает.
+    """
+    if not raw:
+        page_cache.bump_feed_version()
+
+
+@receiver(post_init, sender=User)
+def remember_name(sender, instance, **kwargs):
+    """
+    Запоминает имя пользователя, чтобы заметить переименование автора.
+    Отложенные поля не читаются, чтобы не делать лишний запрос.
+    """
+    instance._loaded_name = (
+        instance.__dict__.get('first_name'),
+        instance.__dict__.get('last_name'),
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Имя автора выводится в карточках постов: после переименования
+    кэш лент устаревает. Вход пользователя и прочие правки его не трогают.
+    """
+    name = (instance.first_name, instance.last_name)
+    if not created and not raw and name != instance._loaded_name:
+        page_cache.bump_feed_version()
+    instance._loaded_name = name
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    После подписки растут счётчики, в ленту добавляются посты автора.
+    """
+    if created and not raw:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """
+    После отписки счётчики уменьшаются, посты автора убираются из ленты.
+    """
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    timeline.purge(instance.user_id, instance.author_id)
@@ -0,0 +1,13 @@
+from django import template
+
+from posts import cards
+
+register = template.Library()
+
+
+@register.filter
+def card_version(post):
+    """
+    Версия карточки поста для ключа {% cache %}.
+    """
+    return cards.version(post)
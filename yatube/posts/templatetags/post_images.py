@@ -0,0 +1,26 @@
+from django import template
+
+from posts import thumbnails, variants
+
+register = template.Library()
+
+
+@register.filter
+def image_sources(post):
+    """
+    Источники <picture> для картинки поста: [(MIME-тип, srcset)].
+    """
+    return variants.sources(post)
+
+
+@register.filter
+def image_box(post):
+    """
+    Ширина и высота показываемой картинки для атрибутов <img> или None.
+    Миниатюра и варианты вырезаны в пропорции ленты.
+    """
+    if post.thumbnail or post.variants:
+        return thumbnails.feed_size()
+    if post.image_width and post.image_height:
+        return post.image_width, post.image_height
+    return None
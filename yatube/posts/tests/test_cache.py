@@ -1,9 +1,15 @@
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.cache import cache, caches
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Post
+from core import metrics
+
+from .. import cards, page_cache
+from ..models import Group, Post
 
 User = get_user_model()
 
@@ -13,25 +19,202 @@ class TestCacheIndex(TestCase):
     def setUpClass(cls):
         super().setUpClass()
         cls.user = User.objects.create_user('Noname')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='cache-group',
+            description='Описание',
+        )
         cls.post = Post.objects.create(
             text='Пост для кэша',
             author=cls.user,
+            group=cls.group,
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
-    def get_response(self):
-        return self.guest_client.get(reverse('posts:index'))
+    def get_response(self, **params):
+        return self.guest_client.get(reverse('posts:index'), params)
 
     def test_cache(self):
         """Тестируем кеширование страницы index"""
         response = self.get_response()
         self.assertContains(response, self.post.text, status_code=200)
 
-        self.post.delete()
-        self.assertContains(response, self.post.text, status_code=200)
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        cached_response = self.get_response()
+        self.assertContains(cached_response, self.post.text)
 
         cache.clear()
         new_response = self.get_response()
         self.assertNotContains(new_response, self.post.text, status_code=200)
+
+    @override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+    def test_cache_hit_skips_queries(self):
+        self.get_response()
+        with self.assertNumQueries(0):
+            self.get_response()
+
+    def test_new_post_shown_immediately(self):
+        self.get_response()
+        Post.objects.create(text='Свежий пост', author=self.user)
+        self.assertContains(self.get_response(), 'Свежий пост')
+
+    def test_deleted_post_hidden_immediately(self):
+        self.get_response()
+        self.post.delete()
+        self.assertNotContains(self.get_response(), self.post.text)
+
+    def test_group_change_invalidates(self):
+        self.get_response()
+        self.group.slug = 'renamed-group'
+        self.group.save()
+        self.assertContains(self.get_response(), 'renamed-group')
+
+    def test_pages_cached_separately(self):
+        Post.objects.bulk_create([
+            Post(text=f'Старый пост {i}', author=self.user)
+            for i in range(settings.PAGINATOR_OBJ_PER_PAGE)
+        ])
+        first = self.get_response()
+        second = self.get_response(page=2)
+        self.assertNotEqual(
+            list(first.context['page_obj']),
+            list(second.context['page_obj']),
+        )
+        self.assertContains(first, 'Старый пост')
+        self.assertNotContains(second, 'Старый пост')
+
+
+@override_settings(PAGE_CACHE_WAIT_TIMEOUT=0.1, PAGE_CACHE_WAIT_INTERVAL=0.01)
+class StaleWhileRevalidateTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user('Noname')
+        cls.post = Post.objects.create(text='Первый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.url = reverse('posts:index')
+
+    def lock(self):
+        request = RequestFactory().get(self.url)
+        cache.add(f'{page_cache._entry_key(request)}:lock', 1)
+
+    def counters(self):
+        return metrics.snapshot()['counters']
+
+    def test_hit_after_recompute(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(self.counters()['page_cache.recomputes'], 1)
+        self.assertEqual(self.counters()['page_cache.hits'], 1)
+
+    def test_stale_served_while_recomputing(self):
+        self.client.get(self.url)
+        Post.objects.create(text='Второй пост', author=self.user)
+        self.lock()
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Второй пост')
+        self.assertEqual(self.counters()['page_cache.stale'], 1)
+
+        cache.clear()
+        self.assertContains(self.client.get(self.url), 'Второй пост')
+
+    def test_concurrent_miss_waits_for_recompute(self):
+        self.lock()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Первый пост')
+        self.assertEqual(self.counters()['page_cache.misses'], 1)
+
+    def test_copy_shared_by_guests_and_users(self):
+        self.assertContains(self.client.get(self.url), 'Войти')
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(self.counters()['page_cache.hits'], 1)
+        self.assertContains(response, 'Выйти')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, 'Войти')
+
+
+class PostCardCacheTest(TestCase):
+    """
+    Карточка поста кэшируется по id, времени правки и имени автора во
+    всех лентах.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user('Noname')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='cards',
+            description='Описание',
+        )
+        cls.first = Post.objects.create(
+            text='Первый пост', author=cls.user, group=cls.group
+        )
+        cls.second = Post.objects.create(
+            text='Второй пост', author=cls.user, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_edit_invalidates_only_its_card(self):
+        urls = (
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.client.get(url)
+        # Изменение в обход save() не трогает updated_at: карточка из кэша.
+        Post.objects.filter(pk=self.first.pk).update(text='Тайная правка')
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.second.pk}),
+            {'text': 'Исправленный пост', 'group': self.group.pk},
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Первый пост')
+                self.assertNotContains(response, 'Тайная правка')
+                self.assertContains(response, 'Исправленный пост')
+
+    def test_author_rename_invalidates_cards(self):
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        self.client.get(url)
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Новое'
+        author.last_name = 'Имя'
+        author.save()
+        self.assertContains(self.client.get(url), 'Автор: Новое Имя')
+        self.assertContains(
+            self.client.get(reverse('posts:index')), 'Автор: Новое Имя'
+        )
+
+    def test_login_keeps_feed_version(self):
+        version = page_cache.feed_version()
+        self.client.force_login(self.user)
+        self.assertEqual(page_cache.feed_version(), version)
+
+    def test_cards_read_from_cache_at_once(self):
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        self.client.get(url)
+        shared = caches['default']
+        shared.forget_all()
+        keys = {cards.fragment_key(post)
+                for post in (self.first, self.second)}
+        with mock.patch.object(shared.l2, 'get_many',
+                               wraps=shared.l2.get_many) as get_many, \
+                mock.patch.object(shared.l2, 'get',
+                                  wraps=shared.l2.get) as get:
+            self.client.get(url)
+        self.assertIn(keys, [set(call.args[0])
+                             for call in get_many.call_args_list])
+        self.assertFalse(keys & {call.args[0] for call in get.call_args_list})
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Post
+
+User = get_user_model()
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentPagesTest(TestCase):
+    """
+    Комментарии поста листаются по курсору, следующие страницы
+    подгружаются фрагментом.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Коммент {i}'
+            )
+            for i in range(5)
+        ]
+        cls.comments.reverse()
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.detail_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        self.fragment_url = reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_detail_shows_first_page(self):
+        response = self.guest_client.get(self.detail_url)
+        page = response.context['comments']
+        self.assertEqual(list(page), self.comments[:2])
+        self.assertIsNone(page.previous_cursor)
+        self.assertContains(
+            response, f'{self.fragment_url}?after={page.next_cursor}'
+        )
+
+    def test_fragment_pages(self):
+        response = self.guest_client.get(self.fragment_url)
+        seen = []
+        while True:
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            seen.extend(page)
+            if page.next_cursor is None:
+                break
+            response = self.guest_client.get(
+                self.fragment_url, {'after': page.next_cursor}
+            )
+        self.assertEqual(seen, self.comments)
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_broken_cursor_gives_first_page(self):
+        response = self.guest_client.get(
+            self.fragment_url, {'after': 'not-a-cursor'}
+        )
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[:2])
+
+    def test_missing_post(self):
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
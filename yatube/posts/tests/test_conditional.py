@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Страницы отвечают 304, пока данные не менялись, и 200 после изменения.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Описание',
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def revalidate(self, url, response, client=None):
+        client = client or self.guest_client
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('ETag', response)
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 304)
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        """
+        Last-Modified точен до секунды: правка в ту же секунду дала бы
+        устаревший 304, поэтому страницы проверяются только по ETag.
+        """
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotIn('Last-Modified', response)
+                repeated = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+                )
+                self.assertEqual(repeated.status_code, 200)
+
+    def test_changes_invalidate_validators(self):
+        changes = (
+            (reverse('posts:index'),
+             lambda: Post.objects.create(text='Новый', author=self.author)),
+            (reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+             lambda: Group.objects.filter(pk=self.group.pk).first().save()),
+            (reverse('posts:profile', kwargs={'username': self.author}),
+             lambda: Follow.objects.create(user=self.reader,
+                                           author=self.author)),
+            (reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+             lambda: Comment.objects.create(post=self.post, text='Коммент',
+                                            author=self.reader)),
+            (reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+             lambda: Comment.objects.filter(post=self.post).delete()),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                change()
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 200)
+
+    def test_viewer_changes_etag(self):
+        url = reverse('posts:index')
+        guest_response = self.guest_client.get(url)
+        response = self.revalidate(url, guest_response, self.authorized_client)
+        self.assertEqual(response.status_code, 200)
+
+    def test_signed_in_etag_is_personal(self):
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
+        self.assertTrue(response['ETag'].endswith(f'-u{self.reader.pk}"'))
+        self.assertContains(response, self.reader.username)
+        self.assertEqual(
+            self.revalidate(url, response, self.authorized_client).status_code,
+            304
+        )
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_cache_control(self):
+        url = reverse('posts:index')
+        guest = self.guest_client.get(url)
+        self.assertIn('public', guest['Cache-Control'])
+        self.assertIn('s-maxage', guest['Cache-Control'])
+        self.assertIn('Cookie', guest['Vary'])
+        reader = self.authorized_client.get(url)
+        self.assertIn('private', reader['Cache-Control'])
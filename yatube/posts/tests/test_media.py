@@ -0,0 +1,127 @@
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core import media
+from core.models import MediaBlob
+
+from .. import thumbnails, variants
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_VARIANT_WIDTHS=(20,))
+class DeduplicatedMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reposter')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, content, name='meme.png'):
+        return Post.objects.create(
+            text='Мем',
+            author=self.user,
+            image=SimpleUploadedFile(name, content),
+        )
+
+    def test_reposted_image_is_stored_once(self):
+        """Повторная загрузка той же картинки не создаёт новый файл."""
+        post = self.create(make_png('red'))
+        repost = self.create(make_png('red'), name='repost.png')
+        other = self.create(make_png('blue'))
+        self.assertEqual(repost.image.name, post.image.name)
+        self.assertNotEqual(other.image.name, post.image.name)
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).refs, 2)
+
+    def test_repost_shares_thumbnail_and_variants(self):
+        """Миниатюра и варианты создаются один раз на файл."""
+        post = self.create(make_png('red'))
+        repost = self.create(make_png('red'), name='repost.png')
+        self.assertTrue(thumbnails.generate(post.pk))
+        self.assertTrue(variants.build(post.pk))
+        with mock.patch.object(
+            variants, 'render', side_effect=AssertionError('render')
+        ), mock.patch.object(
+            thumbnails.default.engine, 'create',
+            side_effect=AssertionError('create'),
+        ):
+            self.assertTrue(thumbnails.generate(repost.pk))
+            self.assertTrue(variants.build(repost.pk))
+        post.refresh_from_db()
+        repost.refresh_from_db()
+        self.assertEqual(repost.thumbnail.name, post.thumbnail.name)
+        self.assertEqual(repost.variants, post.variants)
+
+    def test_sweep_removes_unreferenced_image_with_derived_files(self):
+        """Файл без ссылок удаляется фоновой уборкой вместе с
+        миниатюрами и вариантами."""
+        post = self.create(make_png('green'))
+        repost = self.create(make_png('green'), name='repost.png')
+        thumbnails.generate(post.pk)
+        variants.build(post.pk)
+        post.refresh_from_db()
+        image, storage = post.image, post.image.storage
+        self.assertIsNotNone(thumbnails.ready(image))
+        files = [post.image.name, post.thumbnail.name] + [
+            name for _, name in json.loads(post.variants)['WEBP']
+        ]
+        post.delete()
+        self.assertEqual(media.sweep(grace=0), 0)
+        repost.image = SimpleUploadedFile('new.png', make_png('yellow'))
+        repost.save()
+        self.assertEqual(media.sweep(), 0)
+        self.assertTrue(all(storage.exists(name) for name in files))
+
+        self.assertEqual(media.sweep(grace=0), 1)
+        self.assertFalse(any(storage.exists(name) for name in files))
+        self.assertIsNone(thumbnails.ready(image))
+        self.assertTrue(storage.exists(repost.image.name))
+
+    def test_derived_files_are_hidden_with_deleted_image(self):
+        """
+        Миниатюра и варианты удалённой картинки перестают отдаваться
+        вместе с ней, а до того кэшируются ненадолго.
+        """
+        post = self.create(make_png('purple'))
+        thumbnails.generate(post.pk)
+        variants.build(post.pk)
+        post.refresh_from_db()
+        urls = [post.image.url, post.thumbnail.url] + [
+            post.image.storage.url(name)
+            for _, name in json.loads(post.variants)['WEBP']
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('must-revalidate', response['Cache-Control'])
+                self.assertIn(
+                    f'max-age={settings.MEDIA_PROTECTED_MAX_AGE}',
+                    response['Cache-Control'],
+                )
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
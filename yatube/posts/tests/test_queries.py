@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+# Общий уровень кэша хранится в БД; бюджеты считают только запросы страниц.
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class QueryBudgetTest(TestCase):
+    """
+    Число запросов к БД на страницу не зависит от числа постов
+    и комментариев на ней.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author_{i}')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(12):
+            post = Post.objects.create(
+                text=f'Пост {i}',
+                author=cls.authors[i % 3],
+                group=cls.group,
+            )
+        for author in cls.authors:
+            Comment.objects.create(post=post, author=author, text='Коммент')
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_query_budgets(self):
+        budgets = {
+            reverse('posts:index'): 2,
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}): 2,
+            reverse('posts:profile', kwargs={'username': self.authors[0]}): 3,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}): 3,
+            reverse(
+                'posts:post_comments', kwargs={'post_id': self.post.id}
+            ): 2,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    self.guest_client.get(url)
+
+    def test_follow_index_budget(self):
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse('posts:follow_index'))
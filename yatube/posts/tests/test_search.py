@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    """
+    Полнотекстовый индекс следует за постами и учитывает формы слов.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.cat_post = Post.objects.create(
+            text='Коты любят молоко', author=cls.user
+        )
+        cls.dog_post = Post.objects.create(
+            text='Собака лает на котов, кот убегает от собаки',
+            author=cls.user,
+        )
+
+    def found(self, query):
+        return list(search.search(Post.objects.all(), query))
+
+    def test_stem(self):
+        for word, stem in (
+            ('котами', 'кот'),
+            ('молоко', 'молок'),
+            ('кот', 'кот'),
+            ('django', 'django'),
+        ):
+            with self.subTest(word=word):
+                self.assertEqual(search.stem(word), stem)
+
+    def test_word_forms(self):
+        self.assertEqual(self.found('Собаками'), [self.dog_post])
+        self.assertEqual(self.found('молока'), [self.cat_post])
+        self.assertEqual(self.found('котами любят'), [self.cat_post])
+
+    def test_ranking(self):
+        rare = Post.objects.create(
+            text='Попугай сидит на ветке', author=self.user
+        )
+        frequent = Post.objects.create(
+            text='Попугай попугаю попугай', author=self.user
+        )
+        self.assertEqual(self.found('попугаи'), [frequent, rare])
+
+    def test_empty_and_special_queries(self):
+        self.assertEqual(self.found(''), [])
+        self.assertEqual(self.found('"*) OR ('), [])
+
+    def test_index_follows_edit_and_delete(self):
+        post = Post.objects.create(text='Черепаха', author=self.user)
+        self.assertEqual(self.found('черепахи'), [post])
+        post.text = 'Ёжик'
+        post.save()
+        self.assertEqual(self.found('черепахи'), [])
+        self.assertEqual(self.found('ежики'), [post])
+        post.delete()
+        self.assertEqual(self.found('ежики'), [])
+
+    def test_rebuild(self):
+        Post.objects.bulk_create([Post(text='Попугай', author=self.user)])
+        self.assertEqual(self.found('попугаи'), [])
+        self.assertEqual(search.rebuild(batch_size=1), 3)
+        self.assertEqual(len(self.found('попугаи')), 1)
+
+    def test_search_page(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'котам'})
+        self.assertEqual(
+            set(response.context['page_obj']), {self.dog_post, self.cat_post}
+        )
+        self.assertEqual(response.context['query'], 'котам')
+
+    def test_search_page_paginates(self):
+        Post.objects.bulk_create([
+            Post(text=f'Попугай {i}', author=self.user)
+            for i in range(settings.PAGINATOR_OBJ_PER_PAGE + 1)
+        ])
+        search.rebuild()
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'попугай', 'page': 2}
+        )
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.assertContains(response, 'page=1"')
+        self.assertEqual(
+            response.context['page_obj'].elided_page_range, [1, 2]
+        )
+
+    def test_admin_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'молока'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.cat_post]
+        )
@@ -0,0 +1,205 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from .. import page_cache, thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEST_IMAGE = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def make_gif(shade):
+    buffer = BytesIO()
+    Image.new('L', (4, 2), shade).save(buffer, 'GIF')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='painter')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=TEST_IMAGE,
+                content_type='image/gif',
+            ),
+        )
+
+    def test_thumbnail_is_scheduled_after_commit(self):
+        """Миниатюра и варианты создаются только после коммита и не при
+        показе."""
+        with mock.patch.object(
+            thumbnails.transaction, 'on_commit'
+        ) as on_commit:
+            Post.objects.create(text='Ещё пост', author=self.user)
+            post = Post.objects.create(
+                text='И ещё',
+                author=self.user,
+                image=SimpleUploadedFile('other.gif', TEST_IMAGE),
+            )
+            post.text = 'Правка без новой картинки'
+            post.save()
+        self.assertEqual(on_commit.call_count, 2)
+        self.assertIsNone(thumbnails.ready(post.image))
+
+    def test_card_shows_original_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, в ленте показан оригинал картинки."""
+        self.assertIsNone(thumbnails.ready(self.post.image))
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, self.post.image.url)
+
+        self.assertTrue(thumbnails.generate(self.post.pk))
+        thumbnail = thumbnails.ready(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, f'src="{self.post.image.url}"')
+
+    def test_generate_refreshes_feeds(self):
+        """Созданная миниатюра сбрасывает кэш лент и карточку поста."""
+        version = page_cache.feed_version()
+        updated_at = self.post.updated_at
+        thumbnails.generate(self.post.pk)
+        self.post.refresh_from_db()
+        self.assertGreater(page_cache.feed_version(), version)
+        self.assertGreater(self.post.updated_at, updated_at)
+        self.assertEqual(
+            self.post.thumbnail.name, thumbnails.ready(self.post.image).name
+        )
+        self.assertFalse(thumbnails.generate(self.post.pk))
+
+    def test_new_image_drops_thumbnail(self):
+        """Миниатюра прежней картинки забывается при её замене."""
+        thumbnails.generate(self.post.pk)
+        self.post.refresh_from_db()
+        self.post.text = 'Правка текста'
+        self.post.save()
+        self.assertTrue(self.post.thumbnail)
+        self.post.image = SimpleUploadedFile('new.gif', TEST_IMAGE)
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertFalse(self.post.thumbnail)
+
+    def test_resolve_finds_page_thumbnails_in_one_batch(self):
+        """Готовые миниатюры страницы читаются одним пакетом и
+        запоминаются в постах."""
+        legacy = [self.post, Post.objects.create(
+            text='Второй пост',
+            author=self.user,
+            image=SimpleUploadedFile('second.gif', TEST_IMAGE),
+        )]
+        for post in legacy:
+            get_thumbnail(post.image, thumbnails.FEED_GEOMETRY,
+                          **thumbnails.FEED_OPTIONS)
+        posts = list(Post.objects.order_by('pk'))
+        posts.append(
+            Post.objects.create(text='Без картинки', author=self.user)
+        )
+        # Ключи sorl уже в кэше: остаются запись в посты и учёт миниатюр
+        # как производных от картинок файлов.
+        with self.assertNumQueries(3):
+            thumbnails.resolve(posts)
+        for post in legacy:
+            post.refresh_from_db()
+            self.assertEqual(
+                post.thumbnail.name, thumbnails.ready(post.image).name
+            )
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            thumbnails.resolve(posts)
+
+    def test_resolve_reads_store_on_cache_miss(self):
+        """Без кэша миниатюры находятся одним запросом к хранилищу."""
+        get_thumbnail(self.post.image, thumbnails.FEED_GEOMETRY,
+                      **thumbnails.FEED_OPTIONS)
+        cache.clear()
+        with mock.patch.object(
+            thumbnails.KVStore.objects, 'filter',
+            wraps=thumbnails.KVStore.objects.filter
+        ) as store_filter:
+            thumbnails.resolve([self.post])
+        store_filter.assert_called_once()
+        self.assertEqual(
+            self.post.thumbnail.name, thumbnails.ready(self.post.image).name
+        )
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, self.post.thumbnail.url)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateThumbnailsCommandTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='painter')
+        # Без транзакции on_commit срабатывает сразу, а фоновые миниатюры
+        # здесь не нужны.
+        schedule = mock.patch.object(thumbnails, 'schedule')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=user,
+                image=SimpleUploadedFile(
+                    f'small_{number}.gif', make_gif(number)
+                ),
+            )
+            for number in range(3)
+        ]
+
+    def test_command_generates_missing_thumbnails(self):
+        """Команда записывает готовые миниатюры и параллельно создаёт
+        недостающие."""
+        # Миниатюра создана до появления Post.thumbnail.
+        get_thumbnail(self.posts[0].image, thumbnails.FEED_GEOMETRY,
+                      **thumbnails.FEED_OPTIONS)
+        out = StringIO()
+        # Тестовая SQLite в памяти не даёт писать из двух потоков сразу.
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn(
+            'Найдено готовых миниатюр: 1, создано: 2 из 2', out.getvalue()
+        )
+        for post in self.posts:
+            post.refresh_from_db()
+            self.assertTrue(post.thumbnail)
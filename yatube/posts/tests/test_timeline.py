@@ -0,0 +1,264 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from core.models import CacheInvalidation
+
+from .. import timeline
+from ..models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(
+            text='Пост до подписки',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def timeline_post_ids(self):
+        return list(
+            TimelineEntry.objects.filter(
+                user=self.user
+            ).values_list('post_id', flat=True)
+        )
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.timeline_post_ids(), [self.old_post.id])
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            self.timeline_post_ids(), [new_post.id, self.old_post.id]
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_fan_out_keeps_counts_fresh(self):
+        """
+        Число постов в ленте обновляется после нового поста, а раскладка
+        не публикует инвалидацию на каждого подписчика.
+        """
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(3):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'fan_{i}'),
+                author=self.author,
+            )
+        url = reverse('posts:follow_index')
+        page = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(page.paginator.count, 1)
+        published = CacheInvalidation.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            CacheInvalidation.objects.filter(
+                id__gt=published, key__contains='follower'
+            ).exists()
+        )
+        page = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(page.paginator.count, 2)
+
+    def test_unfollow_purges_timeline(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.timeline_post_ids(), [])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_timeline_is_trimmed(self):
+        """
+        Лента читается не глубже TIMELINE_MAX_LENGTH постов, лишние записи
+        удаляет maintain_timelines.
+        """
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+            for i in range(3)
+        ]
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [posts[2], posts[1]]
+        )
+        call_command('maintain_timelines', stdout=StringIO())
+        self.assertEqual(
+            self.timeline_post_ids(), [posts[2].id, posts[1].id]
+        )
+
+    def test_feed_reads_timeline_index(self):
+        """Страница ленты читается по индексу без сортировки."""
+        plan = timeline.entries(self.user)[:10].explain()
+        self.assertIn('timeline_user_pub_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rebuild_skips_entries_added_meanwhile(self):
+        """Пересборка не падает на записи, добавленной раскладкой поста."""
+        Follow.objects.create(user=self.user, author=self.author)
+        entry = timeline._entry
+
+        def fan_out_meanwhile(user_id, post):
+            TimelineEntry.objects.get_or_create(
+                user_id=user_id,
+                post_id=post.pk,
+                defaults={'author_id': post.author_id,
+                          'pub_date': post.pub_date},
+            )
+            return entry(user_id, post)
+
+        with mock.patch.object(timeline, '_entry', fan_out_meanwhile):
+            timeline.rebuild(self.user.pk)
+        self.assertEqual(self.timeline_post_ids(), [self.old_post.id])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline_post_ids(), [self.old_post.id])
+
+
+@override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+class HybridTimelineTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+        cls.star = User.objects.create_user(username='star')
+        cls.author = User.objects.create_user(username='writer')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        for user in (self.user, self.fan):
+            Follow.objects.create(user=user, author=self.star)
+        Follow.objects.create(user=self.user, author=self.author)
+
+    def test_popular_author_is_not_fanned_out(self):
+        """Посты автора выше порога не раскладываются по лентам."""
+        Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists()
+        )
+        self.assertEqual(
+            metrics.snapshot()['counters']['timeline.fanout_skipped'], 1
+        )
+
+    def test_author_crosses_threshold_both_ways(self):
+        """
+        Автор, вернувшийся под порог, остаётся в pull-режиме, пока его
+        посты не разложены по лентам, и снова уходит в него выше порога.
+        """
+        self.assertIn(self.star.pk, timeline.pulled_authors())
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        with mock.patch.object(timeline, 'schedule_settle') as schedule:
+            Follow.objects.filter(user=self.fan, author=self.star).delete()
+        schedule.assert_called_once_with(self.star.pk)
+        url = reverse('posts:follow_index')
+        cache.clear()
+        page = self.authorized_client.get(url).context['page_obj']
+        self.assertIn(post, page)
+
+        self.assertTrue(timeline.settle(self.star.pk))
+        self.assertNotIn(self.star.pk, timeline.pulled_authors())
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        page = self.authorized_client.get(url).context['page_obj']
+        self.assertIn(post, page)
+
+        Follow.objects.create(user=self.fan, author=self.star)
+        self.assertIn(self.star.pk, timeline.pulled_authors())
+        self.assertFalse(timeline.settle(self.star.pk))
+
+    def test_late_follower_gets_posts_after_pull_mode(self):
+        """
+        Подписавшийся на автора в pull-режиме получает его прежние посты
+        в ленту, когда автор возвращается в push-режим.
+        """
+        with mock.patch.object(timeline, 'schedule_settle'):
+            Follow.objects.filter(author=self.star).delete()
+        timeline.settle(self.star.pk)
+        post = Post.objects.create(text='Старый пост', author=self.star)
+        late = User.objects.create_user(username='late')
+        with mock.patch.object(timeline, 'schedule_settle') as schedule:
+            for user in (self.user, self.fan, late):
+                Follow.objects.create(user=user, author=self.star)
+            Follow.objects.filter(author=self.star).exclude(
+                user=late
+            ).delete()
+        schedule.assert_called_once_with(self.star.pk)
+        self.assertIn(self.star.pk, timeline.pulled_authors())
+        self.assertEqual(list(timeline.feed(late)[:10]), [post])
+
+        self.assertTrue(timeline.settle(self.star.pk))
+        self.assertNotIn(self.star.pk, timeline.pulled_authors())
+        self.assertEqual(list(timeline.feed(late)[:10]), [post])
+
+    def test_maintenance_settles_pending_authors(self):
+        """maintain_timelines досылает посты, если фоновая задача не прошла."""
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        with mock.patch.object(timeline, 'schedule_settle'):
+            Follow.objects.filter(user=self.fan, author=self.star).delete()
+        call_command('maintain_timelines', stdout=StringIO())
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+
+    def test_feed_merges_pulled_posts(self):
+        """Лента подписок сливает push- и pull-посты по дате."""
+        posts = [
+            Post.objects.create(text='Пост автора', author=self.author),
+            Post.objects.create(text='Пост звезды', author=self.star),
+            Post.objects.create(text='Ещё пост автора', author=self.author),
+        ]
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), posts[::-1]
+        )
+        self.assertIn(
+            'timeline.merge_ms', metrics.snapshot()['timings']
+        )
+
+    @override_settings(PAGINATOR_OBJ_PER_PAGE=2)
+    def test_merged_feed_cursor_pages(self):
+        """Слитая лента листается курсорами."""
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=author)
+            for i, author in enumerate((self.author, self.star) * 2)
+        ]
+        url = reverse('posts:follow_index')
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.authorized_client.get(
+            f'{url}?after={first.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(first) + list(second), posts[::-1])
+        self.assertIsNone(second.next_cursor)
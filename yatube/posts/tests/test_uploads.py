@@ -0,0 +1,206 @@
+import io
+import shutil
+import struct
+import tempfile
+import zlib
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import uploads
+from ..forms import PostForm
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_jpeg(size=(64, 48), exif=None):
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, (10, 120, 200))
+    if exif is None:
+        image.save(buffer, 'JPEG')
+    else:
+        image.save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def make_bomb_png(width=50000, height=50000):
+    """
+    PNG в пару сотен байт, который при распаковке занял бы гигабайты.
+    """
+    def chunk(kind, data):
+        body = kind + data
+        return (struct.pack('>I', len(data)) + body
+                + struct.pack('>I', zlib.crc32(body)))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    rows = zlib.compress(b'\x00' * 1024)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', rows) + chunk(b'IEND', b''))
+
+
+def camera_exif():
+    exif = Image.Exif()
+    exif[0x010F] = 'Камера'  # Make
+    exif[0x0112] = 6  # Orientation: повернуть на 90°
+    return exif
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, content, name='photo.jpg'):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    def test_create_keeps_image(self):
+        """Картинка нового поста сохраняется."""
+        response = self.create(make_jpeg())
+        self.assertRedirects(
+            response, reverse('posts:profile', args=[self.user.username])
+        )
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_exif_is_stripped_and_orientation_applied(self):
+        """Метаданные удаляются, поворот из EXIF применяется к пикселям."""
+        self.create(make_jpeg(size=(64, 48), exif=camera_exif()))
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (48, 64))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(UPLOAD_MAX_SIZE=1024)
+    def test_oversized_upload_is_rejected(self):
+        """Файл больше предела отклоняется без сохранения."""
+        content = make_jpeg(size=(600, 600))
+        self.assertGreater(len(content), 1024)
+        response = self.create(content)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error(
+            'image', 'file_too_large'
+        ))
+        self.assertFalse(Post.objects.exists())
+
+    def test_decompression_bomb_is_rejected_by_header(self):
+        """Картинка с огромными размерами отклоняется по заголовку."""
+        response = self.create(make_bomb_png(), name='bomb.png')
+        self.assertTrue(response.context['form'].has_error(
+            'image', 'too_many_pixels'
+        ))
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_pixel_limit(self):
+        """Предел пикселей проверяется до декодирования."""
+        with self.assertRaises(ValidationError) as error:
+            uploads.inspect(io.BytesIO(make_jpeg(size=(40, 40))))
+        self.assertEqual(error.exception.code, 'too_many_pixels')
+        uploads.inspect(io.BytesIO(make_jpeg(size=(20, 20))))
+
+    def test_dimensions_and_placeholder_are_stored(self):
+        """Размеры с учётом поворота и заглушка считаются при загрузке."""
+        self.create(make_jpeg(size=(64, 48), exif=camera_exif()))
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (48, 64))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        self.assertLess(len(post.image_placeholder), 1000)
+
+    def test_feed_renders_size_without_image_io(self):
+        """Лента выводит размеры и заглушку, не открывая картинку."""
+        self.create(make_jpeg(size=(64, 48)))
+        post = Post.objects.get()
+        cache.clear()
+        with mock.patch.object(
+            Image, 'open', side_effect=AssertionError('Image.open')
+        ), mock.patch.object(
+            FileSystemStorage, 'open', side_effect=AssertionError('open')
+        ):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'width="64" height="48"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_upload_is_checked_only_on_validation(self):
+        """Форма проверяет файл при валидации, ошибки — в form.errors."""
+        files = {'image': SimpleUploadedFile('bomb.png', make_bomb_png())}
+        with mock.patch.object(
+            uploads, 'inspect', wraps=uploads.inspect
+        ) as inspect:
+            form = PostForm({'text': 'Пост'}, files)
+            inspect.assert_not_called()
+            self.assertFalse(form.is_valid())
+        inspect.assert_called_once()
+        self.assertTrue(form.has_error('image', 'too_many_pixels'))
+        self.assertIn('image', form.files)
+
+    def test_not_an_image_is_rejected(self):
+        """Не картинка отклоняется."""
+        response = self.create(b'not an image', name='notes.jpg')
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BackfillImageMetadataTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_backfill_fills_missing_metadata(self):
+        """Команда дописывает размеры и заглушки старым постам."""
+        user = User.objects.create_user(username='archivist')
+        with mock.patch('posts.signals.thumbnails'), \
+                mock.patch('posts.signals.variants'):
+            posts = [
+                Post.objects.create(
+                    text=f'Старый пост {number}',
+                    author=user,
+                    image=SimpleUploadedFile(
+                        f'old_{number}.jpg', make_jpeg(size=(30 + number, 20))
+                    ),
+                )
+                for number in range(3)
+            ]
+        Post.objects.update(image_width=None, image_height=None,
+                            image_placeholder='')
+        out = StringIO()
+        # Тестовая SQLite в памяти не даёт писать из двух потоков сразу.
+        call_command('backfill_image_metadata', workers=1, stdout=out)
+        self.assertIn('Обработано картинок: 3 из 3', out.getvalue())
+        for number, post in enumerate(posts):
+            post.refresh_from_db()
+            self.assertEqual(
+                (post.image_width, post.image_height), (30 + number, 20)
+            )
+            self.assertTrue(post.image_placeholder)
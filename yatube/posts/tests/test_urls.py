@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 
 from ..models import Group, Post
@@ -25,6 +26,8 @@ class PostURLTest(TestCase):
         )
 
     def setUp(self):
+        # Страницы лент кэшируются целиком, а тестам нужны шаблоны рендера
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='HasNoName')
         self.authorized_client = Client()
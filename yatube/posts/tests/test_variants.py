@@ -0,0 +1,100 @@
+import io
+import json
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import variants
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(size=(1200, 800), image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   IMAGE_VARIANT_WIDTHS=(480, 960))
+class ImageVariantsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост с фотографией',
+            author=self.user,
+            image=SimpleUploadedFile('photo.jpg', make_image()),
+        )
+
+    def test_render_crops_every_width_and_format(self):
+        """Варианты есть для каждой ширины и формата в пропорции ленты."""
+        rendered = variants.render(io.BytesIO(make_image()))
+        pil_formats = [spec[0] for spec in variants.formats()]
+        self.assertIn('WEBP', pil_formats)
+        self.assertEqual(
+            set(rendered),
+            {(f, w) for f in pil_formats for w in (480, 960)},
+        )
+        with Image.open(io.BytesIO(rendered['WEBP', 480])) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (480, 170))
+
+    def test_build_stores_variants_and_card_uses_srcset(self):
+        """Созданные варианты попадают в srcset карточки."""
+        response = Client().get(reverse('posts:index'))
+        self.assertNotContains(response, 'image/webp')
+
+        self.assertTrue(variants.build(self.post.pk))
+        self.assertFalse(variants.build(self.post.pk))
+        self.post.refresh_from_db()
+        stored = json.loads(self.post.variants)
+        self.assertEqual([width for width, _ in stored['WEBP']], [480, 960])
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        for width, name in stored['WEBP']:
+            self.assertContains(
+                response, f'{self.post.image.storage.url(name)} {width}w'
+            )
+
+    def test_new_image_drops_variants(self):
+        """Варианты прежней картинки забываются при её замене."""
+        variants.build(self.post.pk)
+        self.post.refresh_from_db()
+        self.post.image = SimpleUploadedFile('new.jpg', make_image())
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.variants, '')
+        self.assertEqual(variants.sources(self.post), [])
+
+    def test_bench_reports_savings(self):
+        """Замер печатает размеры вариантов и экономию к JPEG."""
+        sample = tempfile.mkdtemp(dir=TEMP_MEDIA_ROOT)
+        with open(f'{sample}/sample.png', 'wb') as file:
+            file.write(make_image(image_format='PNG'))
+        out = StringIO()
+        call_command('bench_image_variants', sample, stdout=out)
+        self.assertIn('Картинок: 1, пропущено: 0', out.getvalue())
+        self.assertIn('WEBP 480w', out.getvalue())
+        self.assertIn('экономия к JPEG', out.getvalue())
@@ -4,10 +4,14 @@ import tempfile
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from ..counters import recount
 from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
@@ -75,6 +79,8 @@ class PostViewTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        # Страницы лент кэшируются целиком, а тестам нужен контекст рендера
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -277,8 +283,12 @@ class PaginatorViewsTest(TestCase):
             for i in range(1, 15)
         ]
         Post.objects.bulk_create(objs)
+        # bulk_create не шлёт сигналов, пересчитываем счётчики постов
+        recount()
 
     def setUp(self):
+        # и сбрасываем закэшированное число постов
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -309,3 +319,64 @@ class PaginatorViewsTest(TestCase):
                     reverse_name + '?page=2'
                 )
                 self.assertEqual(len(response.context['page_obj']), count)
+
+    def test_cursor_pages(self):
+        """Курсоры ?after= и ?before= листают ленту без номеров страниц."""
+        reverse_names = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for reverse_name in reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                first = self.authorized_client.get(
+                    reverse_name
+                ).context['page_obj']
+                second = self.authorized_client.get(
+                    f'{reverse_name}?after={first.next_cursor}'
+                ).context['page_obj']
+                self.assertEqual(len(second), 4)
+                self.assertIsNone(second.next_cursor)
+                back = self.authorized_client.get(
+                    f'{reverse_name}?before={second.previous_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_shows_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?after=broken'
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 1)
+        self.assertIsNotNone(page.next_cursor)
+        self.assertContains(response, f'?after={page.next_cursor}')
+        self.assertContains(response, '?page=2')
+
+    # Страница сразу устаревает и рендерится заново, число постов — из кэша
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_page_count_is_cached(self):
+        """Число постов берётся из кэша и сбрасывается новым постом."""
+        url = reverse('posts:index') + '?page=2'
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] and '"posts_post"' in query['sql']
+                for query in queries)
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+        Post.objects.create(text='Ещё пост', author=self.user)
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
+
+    @override_settings(PAGINATOR_OBJ_PER_PAGE=1)
+    def test_page_range_is_windowed(self):
+        """Навигация показывает края и окно вокруг текущей страницы."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?page=7'
+        )
+        self.assertEqual(
+            response.context['page_obj'].elided_page_range,
+            [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, '…', 13, 14]
+        )
+        self.assertNotContains(response, '?page=12"')
@@ -0,0 +1,197 @@
+"""
+Миниатюры картинок постов.
+
+Миниатюра для лент создаётся не при первом показе, а в фоне сразу после
+сохранения поста: задача ставится в пул потоков после коммита
+транзакции (PIL отпускает GIL на декодировании и сжатии, поэтому потоки
+работают параллельно). Пока миниатюры нет, шаблон показывает оригинал.
+
+Имя готовой миниатюры записывается в Post.thumbnail, поэтому шаблоны не
+ходят в хранилище ключей sorl за каждым постом. Постам, созданным до
+появления поля, resolve() находит миниатюры для всей страницы разом:
+одним get_many к двухуровневому кэшу и одним запросом к KVStore.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core import media
+
+from . import page_cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FEED_GEOMETRY = '960x339'
+FEED_OPTIONS = {'crop': 'center', 'upscale': True}
+
+_executor = None
+
+
+def _options(backend, source):
+    """
+    Параметры миниатюры с умолчаниями sorl, как в get_thumbnail().
+    """
+    options = dict(FEED_OPTIONS)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def feed_size(width=None):
+    """
+    Размеры миниатюры для лент или её уменьшенной до width копии.
+    """
+    feed_width, feed_height = map(int, FEED_GEOMETRY.split('x'))
+    if width is None:
+        return feed_width, feed_height
+    return width, round(width * feed_height / feed_width)
+
+
+def _thumbnail_file(image):
+    """
+    Файл миниатюры картинки для лент; имя считается без обращения к
+    хранилищу.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    name = backend._get_thumbnail_filename(
+        source, FEED_GEOMETRY, _options(backend, source)
+    )
+    return ImageFile(name, default.storage)
+
+
+def ready(image):
+    """
+    Готовая миниатюра для лент или None; сама миниатюра не создаётся.
+    """
+    if not image:
+        return None
+    return default.kvstore.get(_thumbnail_file(image))
+
+
+def forget(name):
+    """
+    Удаляет миниатюры файла name и записи о них в хранилище ключей sorl.
+    """
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    default.kvstore.delete(source, delete_thumbnails=True)
+
+
+def _lookup(keys):
+    """
+    Значения ключей sorl: из кэша одним get_many, промахи — одним
+    запросом к KVStore с сохранением в кэш.
+    """
+    kv_cache = default.kvstore.cache
+    values = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {
+        key: value for key, value in values.items()
+        if isinstance(value, str)
+    }
+
+
+def resolve(posts):
+    """
+    Находит готовые миниатюры постов страницы, у которых их ещё нет в
+    Post.thumbnail, и запоминает их там вместе со ссылкой миниатюры на
+    картинку (core.media). Возвращает posts.
+    """
+    pending = {}
+    for post in posts:
+        if post.image and not post.thumbnail:
+            key = add_prefix(_thumbnail_file(post.image).key)
+            pending.setdefault(key, []).append(post)
+    if not pending:
+        return posts
+    found = []
+    derived = {}
+    for key, value in _lookup(list(pending)).items():
+        name = deserialize_image_file(value).name
+        derived[pending[key][0].image.name] = [name]
+        for post in pending[key]:
+            post.thumbnail = name
+            found.append(post)
+    if found:
+        Post.objects.bulk_update(found, ['thumbnail'])
+        # Миниатюра отдаётся, пока на картинку есть ссылки.
+        media.attach_many(derived)
+    return posts
+
+
+def generate(post_id):
+    """
+    Создаёт миниатюру поста, если её ещё нет, и записывает её в пост.
+    Возвращает True, если миниатюра записана сейчас.
+    """
+    post = Post.objects.filter(pk=post_id).only('image', 'thumbnail').first()
+    if post is None or not post.image or post.thumbnail:
+        return False
+    try:
+        thumbnail = get_thumbnail(post.image, FEED_GEOMETRY, **FEED_OPTIONS)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру поста %s', post_id)
+        return False
+    # Карточки и страницы с оригиналом вместо миниатюры устарели.
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnail=thumbnail.name, updated_at=timezone.now()
+    )
+    if updated:
+        media.attach(post.image.name, [thumbnail.name])
+        page_cache.bump_feed_version()
+    return bool(updated)
+
+
+def generate_in_thread(post_id):
+    """
+    generate() для фонового потока: соединение с БД закрывается после
+    задачи.
+    """
+    try:
+        return generate(post_id)
+    finally:
+        close_old_connections()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule(post):
+    """
+    Ставит создание миниатюры в фон после коммита транзакции.
+    """
+    if post.image:
+        transaction.on_commit(
+            lambda: executor().submit(generate_in_thread, post.pk)
+        )
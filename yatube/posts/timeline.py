@@ -0,0 +1,456 @@
+"""
+Лента подписок в гибридном режиме: push для обычных авторов, pull для
+популярных.
+
+При публикации пост обычного автора раскладывается по лентам всех его
+подписчиков (fan-out on write), поэтому страница подписок читает готовый
+диапазон по индексу (user, -pub_date). Авторы, у которых подписчиков
+больше TIMELINE_FANOUT_THRESHOLD, не раскладываются: их посты читаются при
+открытии ленты и сливаются с материализованной частью k-путевым слиянием
+по дате публикации.
+
+Когда у pull-автора подписчиков снова становится не больше порога, он
+остаётся в pull-режиме, пока settle() не разложит по лентам его последние
+посты: иначе из лент пропали бы посты, опубликованные в pull-режиме, и
+все посты автора у тех, кто подписался на него в этом режиме.
+
+Лента читается не глубже TIMELINE_MAX_LENGTH записей. Записи сверх него
+не удаляются при каждой публикации, а периодически убираются одним
+запросом trim() (команда maintain_timelines).
+"""
+import copy
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import invalidation, metrics
+
+from . import page_cache, thumbnails
+from .counters import followers_count
+from .models import (FEED_DEFERRED_FIELDS, Follow, Post, TimelineEntry,
+                     UserStats)
+from .paginators import invalidate_counts
+
+FEED_ORDERING = ('-pub_date', '-id')
+
+
+def count_scope(user_id):
+    """
+    Область кэша числа постов в ленте пользователя. Версия ленты в ключе
+    меняется с каждым постом, поэтому при раскладке поста не нужно
+    сбрасывать ключи всех подписчиков по одному.
+    """
+    return f'follower:{user_id}:{page_cache.feed_version()}'
+
+
+def _entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def _pulled_authors_key():
+    return f'timeline:pulled_authors:{settings.TIMELINE_FANOUT_THRESHOLD}'
+
+
+def pulled_authors():
+    """
+    Множество авторов, чьи посты подмешиваются в ленту при чтении.
+    """
+    def collect():
+        return set(
+            UserStats.objects.filter(
+                Q(followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD)
+                | Q(pulled_since__isnull=False)
+            ).values_list('user_id', flat=True)
+        )
+    return cache.get_or_set(
+        _pulled_authors_key(),
+        collect,
+        settings.TIMELINE_PULLED_AUTHORS_TIMEOUT
+    )
+
+
+def _forget_pulled_authors():
+    cache.delete(_pulled_authors_key())
+    invalidation.publish(_pulled_authors_key())
+
+
+def _enter_pull(author_id, followers):
+    """
+    Автор, поднявшийся над порогом, сразу переходит в pull-режим.
+    """
+    if followers == settings.TIMELINE_FANOUT_THRESHOLD + 1:
+        _forget_pulled_authors()
+
+
+def _leave_pull(author_id, followers):
+    """
+    Автор, опустившийся до порога, остаётся в pull-режиме (pulled_since
+    отмечен), пока settle() не разложит его посты по лентам.
+    """
+    if followers != settings.TIMELINE_FANOUT_THRESHOLD:
+        return
+    UserStats.objects.filter(
+        user_id=author_id, pulled_since__isnull=True
+    ).update(pulled_since=timezone.now())
+    schedule_settle(author_id)
+
+
+class MergedFeed:
+    """
+    Лента, слитая из нескольких одинаково упорядоченных источников.
+
+    Поддерживает то, что нужно пагинатору: count(), срезы, filter() и
+    order_by(). Для среза из каждого источника читается не больше stop
+    записей, после чего они сливаются кучей; дубли (автор перешёл через
+    порог) отбрасываются.
+    """
+    model = Post
+
+    def __init__(self, sources, ordering=FEED_ORDERING):
+        self.ordering = ordering
+        self.sources = [source.order_by(*ordering) for source in sources]
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed(
+            [source.filter(*args, **kwargs) for source in self.sources],
+            self.ordering
+        )
+
+    def order_by(self, *ordering):
+        return MergedFeed(self.sources, ordering)
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        keys = [field.lstrip('-') for field in self.ordering]
+        with metrics.timer('timeline.merge_ms'):
+            rows = [list(source[:key.stop]) for source in self.sources]
+            merged = heapq.merge(
+                *rows,
+                key=lambda post: [getattr(post, name) for name in keys],
+                reverse=self.ordering[0].startswith('-')
+            )
+            result = list(islice(self._unique(merged), start, key.stop))
+        metrics.incr('timeline.merge_sources', len(rows))
+        metrics.incr('timeline.merge_rows', sum(len(part) for part in rows))
+        return result
+
+    @staticmethod
+    def _unique(posts):
+        seen = set()
+        for post in posts:
+            if post.pk not in seen:
+                seen.add(post.pk)
+                yield post
+
+
+class TimelineFeed:
+    """
+    Материализованная лента пользователя как последовательность постов.
+
+    Запрос идёт к TimelineEntry и читает диапазон индекса
+    (user, -pub_date, -post) без сортировки; посты с авторами и группами
+    приходят тем же запросом. Поля сортировки и фильтров пагинатора
+    (pub_date, id) переводятся в колонки записи ленты.
+    """
+    model = Post
+    FIELDS = {'id': 'post_id', 'pk': 'post_id'}
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @classmethod
+    def _field(cls, lookup):
+        prefix = '-' if lookup.startswith('-') else ''
+        name, separator, rest = lookup.lstrip('-').partition('__')
+        return prefix + cls.FIELDS.get(name, name) + separator + rest
+
+    @classmethod
+    def _condition(cls, condition):
+        clone = copy.copy(condition)
+        clone.children = [
+            cls._condition(child) if isinstance(child, Q)
+            else (cls._field(child[0]), child[1])
+            for child in condition.children
+        ]
+        return clone
+
+    def filter(self, *args, **kwargs):
+        return TimelineFeed(self.entries.filter(
+            *(self._condition(condition) for condition in args),
+            **{self._field(key): value for key, value in kwargs.items()}
+        ))
+
+    def order_by(self, *ordering):
+        return TimelineFeed(
+            self.entries.order_by(*(self._field(key) for key in ordering))
+        )
+
+    def count(self):
+        return self.entries[:settings.TIMELINE_MAX_LENGTH].count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = settings.TIMELINE_MAX_LENGTH
+        if key.stop is not None:
+            stop = min(key.stop, stop)
+        if start >= stop:
+            return []
+        return [entry.post for entry in self.entries[start:stop]]
+
+
+def entries(user):
+    """
+    Записи ленты пользователя с постами, от новых к старым.
+    """
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).defer(
+        *(f'post__{field}' for field in FEED_DEFERRED_FIELDS)
+    ).order_by('-pub_date', '-post_id')
+
+
+def feed(user):
+    """
+    Посты из ленты подписок пользователя, от новых к старым.
+    """
+    pushed = TimelineFeed(entries(user))
+    pulled = pulled_authors()
+    if pulled:
+        pulled = [
+            author_id
+            for author_id in Follow.objects.filter(
+                user=user
+            ).values_list('author_id', flat=True)
+            if author_id in pulled
+        ]
+    if not pulled:
+        return pushed
+    metrics.incr('timeline.pulled_feeds')
+    return MergedFeed(
+        [pushed] + [
+            Post.objects.for_feed().filter(author_id=author_id)
+            for author_id in pulled
+        ]
+    )
+
+
+def fan_out(post):
+    """
+    Раскладывает новый пост по лентам подписчиков автора.
+    """
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    metrics.gauge('timeline.fanout_threshold', threshold)
+    if followers_count(post.author_id) > threshold:
+        UserStats.objects.filter(
+            user_id=post.author_id, pulled_since__isnull=True
+        ).update(pulled_since=post.pub_date)
+        metrics.incr('timeline.fanout_skipped')
+        return
+    follower_ids = list(
+        Follow.objects.filter(
+            author_id=post.author_id
+        ).values_list('user_id', flat=True)
+    )
+    with metrics.timer('timeline.fanout_ms'):
+        TimelineEntry.objects.bulk_create(
+            [_entry(user_id, post) for user_id in follower_ids],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    # Число постов в лентах подписчиков устарело вместе с версией ленты,
+    # которую сигнал поста уже сменил (см. count_scope).
+    metrics.incr('timeline.fanout_rows', len(follower_ids))
+
+
+def backfill(user_id, author_id):
+    """
+    Добавляет в ленту последние посты автора после подписки на него.
+    """
+    invalidate_counts(count_scope(user_id))
+    followers = followers_count(author_id)
+    _enter_pull(author_id, followers)
+    if followers > settings.TIMELINE_FANOUT_THRESHOLD:
+        # Посты автора досылает settle(), когда он вернётся в push-режим.
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'id', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for post in posts],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def purge(user_id, author_id):
+    """
+    Убирает из ленты посты автора после отписки от него.
+    """
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    invalidate_counts(count_scope(user_id))
+    _leave_pull(author_id, followers_count(author_id))
+
+
+def _fan_out_latest(author_id):
+    """
+    Одним INSERT … SELECT добавляет в ленты всех подписчиков автора его
+    последние TIMELINE_MAX_LENGTH постов; уже разложенные пропускаются.
+    Возвращает число добавленных записей.
+    """
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            {ops.insert_statement(ignore_conflicts=True)}
+                {TimelineEntry._meta.db_table}
+                (user_id, post_id, author_id, pub_date)
+            SELECT follow.user_id, post.id, post.author_id, post.pub_date
+            FROM {Follow._meta.db_table} follow, (
+                SELECT id, author_id, pub_date FROM {Post._meta.db_table}
+                WHERE author_id = %s
+                ORDER BY pub_date DESC, id DESC
+                LIMIT %s
+            ) post
+            WHERE follow.author_id = %s
+            {ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}
+            ''',
+            [
+                author_id,
+                settings.TIMELINE_MAX_LENGTH,
+                author_id,
+            ],
+        )
+        return cursor.rowcount
+
+
+def settle(author_id):
+    """
+    Раскладывает по лентам подписчиков последние посты автора и выводит
+    его из pull-режима. Досылаются и посты, опубликованные в этом режиме,
+    и посты для подписавшихся в нём. Возвращает False, если подписчиков
+    у автора снова больше порога.
+    """
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    row = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', 'pulled_since'
+    ).first()
+    if row is None or row[0] > threshold:
+        return False
+    with transaction.atomic():
+        rows = _fan_out_latest(author_id)
+        UserStats.objects.filter(
+            user_id=author_id,
+            pulled_since=row[1],
+            followers_count__lte=threshold,
+        ).update(pulled_since=None)
+    metrics.incr('timeline.settled_rows', rows)
+    page_cache.bump_feed_version()
+    _forget_pulled_authors()
+    return True
+
+
+def settle_in_thread(author_id):
+    """
+    settle() для фонового потока: соединение с БД закрывается после
+    задачи.
+    """
+    try:
+        return settle(author_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_settle(author_id):
+    """
+    Ставит settle() в фоновый пул миниатюр после коммита транзакции.
+    """
+    transaction.on_commit(
+        lambda: thumbnails.executor().submit(settle_in_thread, author_id)
+    )
+
+
+def settle_pending():
+    """
+    settle() для всех авторов, ждущих выхода из pull-режима: страховка
+    на случай, если фоновая задача не выполнилась. Возвращает их число.
+    """
+    author_ids = UserStats.objects.filter(
+        pulled_since__isnull=False,
+        followers_count__lte=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).values_list('user_id', flat=True)
+    return sum(settle(author_id) for author_id in author_ids)
+
+
+def trim(user_id=None):
+    """
+    Обрезает ленту пользователя или, без user_id, все ленты до
+    TIMELINE_MAX_LENGTH самых свежих записей одним запросом.
+    Возвращает число удалённых записей.
+    """
+    table = TimelineEntry._meta.db_table
+    where, params = '', []
+    if user_id is not None:
+        where, params = 'WHERE user_id = %s', [user_id]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id
+                        ORDER BY pub_date DESC, post_id DESC
+                    ) AS position
+                    FROM {table} {where}
+                ) ranked
+                WHERE position > %s
+            )
+            ''',
+            params + [settings.TIMELINE_MAX_LENGTH],
+        )
+        return cursor.rowcount
+
+
+def rebuild(user_id):
+    """
+    Полностью пересобирает ленту пользователя по его подпискам.
+    Старые записи заменяются новыми в одной транзакции, поэтому читатели
+    не видят пустую ленту; запись, добавленную раскладкой поста в это
+    время, пересборка пропускает.
+    """
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).exclude(
+        author_id__in=pulled_authors()
+    ).only('id', 'author_id', 'pub_date')[:settings.TIMELINE_MAX_LENGTH]
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        TimelineEntry.objects.bulk_create(
+            [_entry(user_id, post) for post in posts],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    invalidate_counts(count_scope(user_id))
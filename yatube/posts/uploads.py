@@ -0,0 +1,123 @@
+"""
+Проверка и очистка загружаемых картинок постов.
+
+Заголовок картинки читается без декодирования пикселей: формат и размеры
+проверяются до того, как Pillow развернёт файл в память, поэтому
+«бомба» (крошечный файл с огромными размерами) отклоняется сразу.
+Принятая картинка пережимается без EXIF и прочих метаданных: в хранилище
+попадает файл меньше исходного и без координат съёмки.
+
+Размеры и крошечная размытая заглушка (LQIP, data: URI) считаются один
+раз при сохранении, чтобы шаблоны не открывали файл картинки.
+"""
+import base64
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageFilter, ImageOps
+
+# Форматы, которые принимаются, и параметры их пережатия.
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'GIF': {},
+    'WEBP': {'quality': 85},
+}
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+# Значения EXIF Orientation, при которых картинка повёрнута на 90°.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+
+def inspect(file):
+    """
+    Формат картинки по заголовку. Неизвестный формат и слишком большие
+    размеры дают ValidationError; пиксели не декодируются.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise _too_many_pixels()
+    except (OSError, SyntaxError):
+        raise _invalid_image()
+    finally:
+        file.seek(0)
+    if image_format not in SAVE_OPTIONS:
+        raise _invalid_image()
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise _too_many_pixels()
+    return image_format
+
+
+def _invalid_image():
+    return ValidationError(
+        'Загрузите картинку в формате JPEG, PNG, GIF или WebP.',
+        code='invalid_image',
+    )
+
+
+def _too_many_pixels():
+    return ValidationError(
+        'Картинка больше %(limit)s мегапикселей.',
+        code='too_many_pixels',
+        params={'limit': settings.IMAGE_MAX_PIXELS // 10 ** 6},
+    )
+
+
+def sanitize(file):
+    """
+    Картинка без метаданных: поворот из EXIF применяется к пикселям,
+    остальные метаданные отбрасываются. Анимированные GIF не трогаются.
+    """
+    image_format = inspect(file)
+    with Image.open(file) as image:
+        if getattr(image, 'is_animated', False):
+            file.seek(0)
+            return file
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        options = dict(SAVE_OPTIONS[image_format])
+        if image_format in ('GIF', 'PNG') and 'transparency' in image.info:
+            options['transparency'] = image.info['transparency']
+        image.save(buffer, image_format, **options)
+    return SimpleUploadedFile(
+        os.path.basename(file.name),
+        buffer.getvalue(),
+        CONTENT_TYPES[image_format],
+    )
+
+
+def describe(file):
+    """
+    Ширина, высота с учётом поворота из EXIF и заглушка картинки.
+    JPEG декодируется в уменьшенном масштабе, поэтому это дёшево.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            small = ImageOps.exif_transpose(image).convert('RGB')
+    finally:
+        file.seek(0)
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=PLACEHOLDER_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{encoded}'
@@ -0,0 +1,156 @@
+"""
+Адаптивные варианты картинок постов.
+
+Картинка поста режется так же, как миниатюра для лент (по центру в
+пропорции FEED_GEOMETRY), и сохраняется в нескольких ширинах
+IMAGE_VARIANT_WIDTHS в WebP и, если Pillow умеет его писать, в AVIF.
+Карточка отдаёт их через <picture> и srcset, поэтому телефон скачивает
+узкий вариант в современном формате, а не JPEG для компьютера.
+
+Варианты создаются в том же фоновом пуле, что и миниатюры; список
+файлов хранится в Post.variants как JSON. Посты с одним файлом картинки
+делят и варианты, а сами файлы вариантов удаляются вместе с ним.
+"""
+import io
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import media
+
+from . import page_cache, thumbnails
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'posts/variants/'
+# Формат Pillow, MIME-тип, расширение и качество; лучшие форматы первыми.
+FORMATS = (
+    ('AVIF', 'image/avif', 'avif', 60),
+    ('WEBP', 'image/webp', 'webp', 80),
+)
+
+
+def formats():
+    """
+    Форматы из FORMATS, которые умеет писать установленный Pillow.
+    """
+    Image.init()
+    return [spec for spec in FORMATS if spec[0] in Image.SAVE]
+
+
+def render(file):
+    """
+    Варианты картинки из файла: {(формат Pillow, ширина): байты}.
+    Ничего не сохраняет, поэтому годится и для замеров.
+    """
+    with Image.open(file) as source:
+        source = ImageOps.exif_transpose(source)
+        source = source.convert(
+            'RGBA' if 'transparency' in source.info
+            or source.mode in ('RGBA', 'LA') else 'RGB'
+        )
+        rendered = {}
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            image = ImageOps.fit(
+                source, thumbnails.feed_size(width), method=Image.LANCZOS
+            )
+            for pil_format, _, _, quality in formats():
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, quality=quality)
+                rendered[pil_format, width] = buffer.getvalue()
+    return rendered
+
+
+def build(post_id):
+    """
+    Создаёт варианты картинки поста, если их ещё нет, и записывает их в
+    пост. Возвращает True, если варианты записаны сейчас.
+    """
+    post = Post.objects.filter(pk=post_id).only('image', 'variants').first()
+    if post is None or not post.image or post.variants:
+        return False
+    # Одинаковые картинки хранятся одним файлом, варианты у них общие.
+    shared = Post.objects.filter(image=post.image.name).exclude(
+        variants=''
+    ).values_list('variants', flat=True).first()
+    if shared:
+        return _store(post, shared)
+    try:
+        with post.image.open('rb') as file:
+            rendered = render(file)
+    except Exception:
+        logger.exception('Не удалось создать варианты картинки поста %s',
+                         post_id)
+        return False
+    storage = post.image.storage
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    extensions = {spec[0]: spec[2] for spec in FORMATS}
+    variants = {}
+    for (pil_format, width), data in sorted(rendered.items()):
+        name = storage.save(
+            f'{VARIANTS_DIR}{stem}-{width}.{extensions[pil_format]}',
+            ContentFile(data),
+        )
+        variants.setdefault(pil_format, []).append([width, name])
+    media.attach(post.image.name, [
+        name for files in variants.values() for _, name in files
+    ])
+    return _store(post, json.dumps(variants))
+
+
+def _store(post, variants):
+    updated = Post.objects.filter(pk=post.pk, image=post.image.name).update(
+        variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        page_cache.bump_feed_version()
+    return bool(updated)
+
+
+def build_in_thread(post_id):
+    """
+    build() для фонового потока: соединение с БД закрывается после
+    задачи.
+    """
+    try:
+        return build(post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """
+    Ставит создание вариантов в фоновый пул миниатюр после коммита.
+    """
+    if post.image:
+        transaction.on_commit(
+            lambda: thumbnails.executor().submit(build_in_thread, post.pk)
+        )
+
+
+def sources(post):
+    """
+    Источники для <picture>: [(MIME-тип, srcset)] от лучшего формата.
+    """
+    if not post.variants:
+        return []
+    variants = json.loads(post.variants)
+    storage = post.image.storage
+    return [
+        (
+            mime,
+            ', '.join(
+                f'{storage.url(name)} {width}w'
+                for width, name in variants[pil_format]
+            ),
+        )
+        for pil_format, mime, _, _ in FORMATS
+        if pil_format in variants
+    ]
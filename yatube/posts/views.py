@@ -1,35 +1,74 @@
+from functools import partial
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
 
+from . import cards, counters, page_cache, search, thumbnails, timeline
+from .conditional import cache_for_guests, feed_etag, post_etag, profile_etag
 from .forms import CommentForm, PostForm
 from .models import Comment, Follow, Group, Post, User
+from .paginators import (CountingPaginator, CursorPaginator,
+                         NumberedPaginator, estimate_table_size)
 
 
+@cache_for_guests
+@page_cache.stale_while_revalidate
+@condition(etag_func=feed_etag)
 def index(request):
     """
     Главная страница. Отображает все последние опубликованные посты
+
+    Разметка ленты кэшируется по версии ленты и положению страницы и
+    общая для всех посетителей; страница читается из БД только при
+    промахе кэша.
+    Версия ленты служит и валидатором условного GET.
+    Запросов к БД: 2 (число постов, если его нет в кэше, и страница).
+    Миниатюры постов без Post.thumbnail ищутся для всей страницы разом.
     """
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJ_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    paginator = CountingPaginator(
+        post_list,
+        settings.PAGINATOR_OBJ_PER_PAGE,
+        scope='posts',
+        estimate=partial(estimate_table_size, Post)
+    )
+    page_obj = SimpleLazyObject(lambda: cards.prefetch(
+        thumbnails.resolve(paginator.page_for_request(request))
+    ))
     context = {
         'page_obj': page_obj,
+        'cache_timeout': settings.INDEX_CACHE_TIMEOUT,
+        'feed_version': page_cache.feed_version(),
+        'page_key': page_cache.page_key(request),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_for_guests
+@page_cache.stale_while_revalidate
+@condition(etag_func=feed_etag)
 def group_posts(request, slug):
     """
     Страница группы. Показывает отфильтрованные по группе посты.
+
+    Запросов к БД: 2 (группа со счётчиком постов и страница).
     """
     group = get_object_or_404(Group, slug=slug)
-    group_posts_list = group.posts.all()
-    paginator = Paginator(group_posts_list, settings.PAGINATOR_OBJ_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group_posts_list = group.posts.for_feed()
+    paginator = CountingPaginator(
+        group_posts_list,
+        settings.PAGINATOR_OBJ_PER_PAGE,
+        count=group.posts_count
+    )
+    page_obj = cards.prefetch(
+        thumbnails.resolve(paginator.page_for_request(request)),
+        hide_group=True
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -37,49 +76,128 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_for_guests
+@condition(etag_func=profile_etag)
 def profile(request, username):
     """
     Страница профиля. Показывает отфильтрованные по пользователю посты.
+
+    Запросов к БД: 3 (валидатор условного GET, автор со счётчиками и
+    страница). Кнопка подписки подставляется после рендера, для
+    вошедшего пользователя это ещё один запрос.
     """
-    author = get_object_or_404(User, username=username)
-    user_post_list = Post.objects.filter(author__username=username)
-    paginator = Paginator(user_post_list, settings.PAGINATOR_OBJ_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    qs = Follow.objects.filter(user_id=request.user.id, author_id=author.id)
-    if qs.exists():
-        following = True
-    else:
-        following = False
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    stats = counters.user_stats(author)
+    user_post_list = Post.objects.for_feed().filter(author=author)
+    paginator = CountingPaginator(
+        user_post_list,
+        settings.PAGINATOR_OBJ_PER_PAGE,
+        count=stats.posts_count
+    )
+    page_obj = cards.prefetch(
+        thumbnails.resolve(paginator.page_for_request(request))
+    )
     context = {
-        'following': following,
         'author': author,
+        'stats': stats,
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_search(request):
+    """
+    Поиск по текстам постов. Результаты упорядочены по релевантности.
+
+    Запросов к БД: 2 (число найденных постов и страница).
+    """
+    query = request.GET.get('q', '').strip()
+    paginator = NumberedPaginator(
+        search.search(Post.objects.for_feed(), query),
+        settings.PAGINATOR_OBJ_PER_PAGE
+    )
+    page_obj = cards.prefetch(
+        thumbnails.resolve(paginator.page_for_request(request))
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@cache_for_guests
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     """
     Просмотр выбранного поста.
+
+    Показывается первая страница комментариев (или страница после
+    ?after=), следующие подгружаются фрагментом post_comments.
+    Запросов к БД: 3 (валидатор условного GET, пост с автором, его
+    счётчиками и группой, страница комментариев с авторами).
     """
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related('author__stats'), pk=post_id
+    )
+    thumbnails.resolve([post])
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.filter(post__id=post_id)
     context = {
         'post': post,
-        'comments': comments,
+        'author_stats': counters.user_stats(post.author),
+        'comments': _comments_page(request, post_id),
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_paginator(post_id):
+    """
+    Курсорный пагинатор комментариев поста, новые первыми.
+    """
+    return CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        ordering=('-created', '-id'),
+    )
+
+
+def _comments_page(request, post_id):
+    """
+    Комментарии поста после курсора ?after=.
+    """
+    return comments_paginator(post_id).page_after(request.GET.get('after'))
+
+
+@cache_for_guests
+@condition(etag_func=post_etag)
+def post_comments(request, post_id):
+    """
+    Страница комментариев поста фрагментом HTML для подгрузки на
+    странице поста.
+
+    Запросов к БД: 2 (валидатор условного GET и страница комментариев
+    с авторами).
+    """
+    # Валидаторы уже прочитаны condition и запомнены в запросе.
+    if post_etag(request, post_id) is None:
+        raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': _comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     """
     Страница создания поста.
     """
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'POST':
         if form.is_valid():
             post = form.save(commit=False)
@@ -95,6 +213,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     """
     Страница редактирования поста.
@@ -118,6 +237,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     """
     Добавление комментария.
@@ -135,12 +255,21 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """
-    Страница подписок. Фильтрует посты по отслеживаемым пользователям
+    Страница подписок. Читает материализованную ленту пользователя
+
+    Запросов к БД: 3 (список pull-авторов, число постов и страница)
+    сверх сессии и пользователя; ещё один, если пользователь подписан
+    на pull-авторов.
     """
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJ_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = timeline.feed(request.user)
+    paginator = CountingPaginator(
+        post_list,
+        settings.PAGINATOR_OBJ_PER_PAGE,
+        scope=timeline.count_scope(request.user.pk)
+    )
+    page_obj = cards.prefetch(
+        thumbnails.resolve(paginator.page_for_request(request))
+    )
     context = {
         'page_obj': page_obj,
     }
@@ -148,6 +277,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     """
     Кнопка подписки на пользователя
@@ -161,6 +291,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     """
     Кнопка отписки от пользователя
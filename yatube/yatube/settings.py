@@ -54,12 +54,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.cache_invalidation_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.late_fragments_middleware',
 ]
 
 INTERNAL_IPS = [
@@ -80,6 +82,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.cache_timeouts.cache_timeouts',
             ],
         },
     },
@@ -138,6 +141,9 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic добавляет хэш к именам и кладёт рядом .gz и .br
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -154,3 +160,94 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 # Переменная, указывающая количество выводимых страниц
 PAGINATOR_OBJ_PER_PAGE = 10
+# Сколько комментариев показывается на странице поста и подгружается за раз
+COMMENTS_PER_PAGE = 20
+# Сколько последних постов хранится в материализованной ленте подписок
+TIMELINE_MAX_LENGTH = 1000
+# Авторы, у которых подписчиков больше порога, не раскладываются по лентам:
+# их посты подмешиваются в ленту подписок при чтении
+TIMELINE_FANOUT_THRESHOLD = 10000
+# Сколько секунд кэшируется список таких авторов
+TIMELINE_PULLED_AUTHORS_TIMEOUT = 60
+# Сколько секунд кэшируется число постов для номеров страниц
+PAGINATOR_COUNT_TIMEOUT = 60
+# Выше этого числа постов точный COUNT(*) заменяется оценкой
+PAGINATOR_COUNT_ESTIMATE_THRESHOLD = 100000
+# Сколько секунд хранится закэшированная главная страница; новые посты
+# видны сразу, так как сигналы меняют версию ключа кэша
+INDEX_CACHE_TIMEOUT = 60 * 60 * 6
+# Кэш двух уровней: память воркера (L1) перед общим для воркеров кэшем (L2).
+# Таблицу общего кэша создаёт миграция приложения core
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            # Размер L1 в байтах, старые записи вытесняются первыми
+            'L1_MAX_BYTES': 32 * 1024 * 1024,
+            # Сколько секунд запись живёт в L1
+            'L1_TIMEOUT': 5,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'yatube_cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+# Поиск миниатюр sorl-thumbnail идёт через тот же двухуровневый кэш
+THUMBNAIL_CACHE = 'default'
+# Как часто (в секундах) воркер читает события шины инвалидации кэша
+CACHE_INVALIDATION_POLL_INTERVAL = 1
+# Сколько секунд события шины хранятся в БД
+CACHE_INVALIDATION_RETENTION = 600
+# Сколько секунд обратный прокси может отдавать гостям страницу без
+# перепроверки по ETag
+PAGE_PROXY_CACHE_TIMEOUT = 10
+# Сколько секунд гостевая страница ленты считается свежей
+PAGE_CACHE_TIMEOUT = 60
+# Сколько ещё секунд устаревшая страница отдаётся, пока её пересчитывают
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60
+# Блокировка пересчёта страницы снимается не позже чем через столько секунд
+PAGE_CACHE_LOCK_TIMEOUT = 10
+# Сколько секунд запрос ждёт чужого пересчёта, если копии ещё нет,
+# и как часто проверяет кэш
+PAGE_CACHE_WAIT_TIMEOUT = 2
+PAGE_CACHE_WAIT_INTERVAL = 0.05
+# Сколько секунд хранится разметка карточки поста; правка поста меняет
+# её ключ через updated_at
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Сколько потоков создают миниатюры картинок в фоне
+THUMBNAIL_WORKERS = 2
+# Ширины адаптивных вариантов картинок постов (WebP, AVIF) в пикселях
+IMAGE_VARIANT_WIDTHS = (480, 720, 960)
+# Загрузки: сначала проверка размера, потом стандартные обработчики
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Предельный размер загружаемого файла в байтах
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+# Предельное число пикселей картинки, защита от «бомб» при распаковке
+IMAGE_MAX_PIXELS = 40 * 10 ** 6
+# Через сколько секунд после снятия последней ссылки файл можно удалить
+MEDIA_SWEEP_GRACE = 60 * 60
+# Кто отдаёт медиафайлы: 'python' (FileResponse), 'x-accel-redirect' (nginx)
+# или 'x-sendfile' (Apache, lighttpd)
+MEDIA_SERVE_BACKEND = 'python'
+# Internal-location nginx, в которую ведёт X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Сколько секунд браузер и прокси хранят медиафайлы: имена по содержимому
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+# То же для файлов с проверкой доступа: доступ может быть закрыт
+MEDIA_PROTECTED_MAX_AGE = 60
+# Internal-location nginx для статики
+STATIC_ACCEL_PREFIX = '/protected-static/'
+# Сколько секунд кэшируется статика с хэшем в имени и без него
+STATIC_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_PLAIN_MAX_AGE = 5 * 60